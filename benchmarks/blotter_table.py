@@ -0,0 +1,45 @@
+"""
+Compares parsing a synthetic activity log page with a full BeautifulSoup tree
+(``BlotterEntry.from_page()``) against the tree-less extractor used by the
+scraper (``parse_blotter_page()``).
+
+Usage: python -m benchmarks.blotter_table [--rows N] [--repeat N]
+"""
+from argparse import ArgumentParser
+from timeit import repeat
+
+from bs4 import BeautifulSoup
+
+from blotter import BlotterEntry, parse_blotter_page
+from icbot.config import settings
+from tests.fake_police_log import make_activity_log_page
+
+
+def make_blotter_page(row_count: int) -> str:
+    return make_activity_log_page(23000000 + i for i in range(row_count))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    page = make_blotter_page(args.rows)
+    assert [BlotterEntry(**fields) for fields in parse_blotter_page(page, settings.POLICE_LOG_URL)] \
+        == BlotterEntry.from_page(BeautifulSoup(page, "html.parser"))
+    timings = {
+        "BeautifulSoup tree": min(repeat(
+            lambda: BlotterEntry.from_page(BeautifulSoup(page, "html.parser")),
+            number=1,
+            repeat=args.repeat
+        )),
+        "Table extractor": min(repeat(
+            lambda: parse_blotter_page(page, settings.POLICE_LOG_URL),
+            number=1,
+            repeat=args.repeat
+        ))
+    }
+    print(f"{args.rows} rows ({len(page) / 1024:.0f} KiB), best of {args.repeat}:")
+    for label, seconds in timings.items():
+        print(f"  {label:<20} {seconds * 1000:8.1f} ms  {args.rows / seconds:10.0f} rows/s")
+    print("  Speedup: {:.1f}x".format(timings["BeautifulSoup tree"] / timings["Table extractor"]))
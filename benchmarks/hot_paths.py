@@ -0,0 +1,194 @@
+"""
+Times the hot paths of a run (parsing activity log and detail pages, applying
+the blocking filters and building Google Sheets requests) on synthetic pages
+of increasing size, reporting throughput and peak memory. Results may be saved
+as JSON and compared with those saved at another commit.
+
+Usage: python -m benchmarks.hot_paths [--rows N [N ...]] [--only NAME [NAME ...]]
+    [--repeat N] [--output FILE] [--compare FILE]
+"""
+import json, platform, subprocess, tracemalloc
+from argparse import ArgumentParser
+from dataclasses import asdict, dataclass
+from datetime import date, datetime
+from pathlib import Path
+from timeit import repeat
+from typing import Any, Callable, Optional
+
+from bs4 import BeautifulSoup
+
+from blotter import BlotterEntry, parse_blotter_page, parse_details_page
+from icbot.config import settings
+from scraper import DispatchEntrySet
+from storage.google_sheets import GoogleSheetsStorage
+from tests.fake_police_log import make_details_page as make_fake_details_page
+from .blotter_table import make_blotter_page
+
+DEFAULT_ROW_COUNTS = [10, 100, 1000, 10000]
+DETAILS_TEMPLATES = [
+    "Caller reports {n} loud music from neighboring unit",
+    "CREATED FROM MOBILE {n}",
+    "Subject located and advised; case #{n}",
+    "OLN/{n} checked, valid"
+]
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    rows: int
+    # Best of the repeated runs
+    seconds: float
+    peak_memory: int
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else float("inf")
+
+
+def make_details(i: int) -> str:
+    return DETAILS_TEMPLATES[i % len(DETAILS_TEMPLATES)].format(n=i)
+
+
+def make_details_page(i: int) -> str:
+    return make_fake_details_page(23000000 + i, make_details(i))
+
+
+def make_entries(row_count: int) -> list[BlotterEntry]:
+    return [BlotterEntry(**fields) for fields in parse_blotter_page(
+        make_blotter_page(row_count), settings.POLICE_LOG_URL
+    )]
+
+
+# Each benchmark does its setup given a row count, and returns the function to
+# be timed
+
+def bench_from_page(row_count: int) -> Callable[[], Any]:
+    page = make_blotter_page(row_count)
+    return lambda: BlotterEntry.from_page(BeautifulSoup(page, "html.parser"))
+
+
+def bench_parse_blotter_page(row_count: int) -> Callable[[], Any]:
+    page = make_blotter_page(row_count)
+    return lambda: parse_blotter_page(page, settings.POLICE_LOG_URL)
+
+
+def bench_set_details_from_page(row_count: int) -> Callable[[], Any]:
+    entries = make_entries(row_count)
+    pages = [make_details_page(i) for i in range(row_count)]
+
+    def run():
+        for entry, page in zip(entries, pages):
+            entry.set_details_from_page(BeautifulSoup(page, "html.parser"))
+
+    return run
+
+
+def bench_parse_details_page(row_count: int) -> Callable[[], Any]:
+    pages = [make_details_page(i) for i in range(row_count)]
+    return lambda: [parse_details_page(page) for page in pages]
+
+
+def bench_exclude(row_count: int) -> Callable[[], Any]:
+    # Details are filled in for some entries and not yet for others, as they
+    # are when the scraper filters before and after fetching them
+    entries = make_entries(row_count)
+    for i, entry in enumerate(entries):
+        if i % 2:
+            entry.details = make_details(i)
+    return lambda: [entry.exclude for entry in entries]
+
+
+def bench_sheets_requests(row_count: int) -> Callable[[], Any]:
+    entries = make_entries(row_count)
+    for i, entry in enumerate(entries):
+        entry.details = make_details(i)
+    entry_set = DispatchEntrySet(date=date(2023, 2, 15), entries=entries)
+    storage = GoogleSheetsStorage(spreadsheet_id="benchmark", client_secrets_file="")
+    return lambda: list(storage.chunk_requests(storage.get_store_requests(entry_set, set())))
+
+
+BENCHMARKS: dict[str, Callable[[int], Callable[[], Any]]] = {
+    "from_page": bench_from_page,
+    "parse_blotter_page": bench_parse_blotter_page,
+    "set_details_from_page": bench_set_details_from_page,
+    "parse_details_page": bench_parse_details_page,
+    "exclude": bench_exclude,
+    "sheets_requests": bench_sheets_requests
+}
+
+
+def measure(name: str, row_count: int, repeat_count: int) -> BenchmarkResult:
+    func = BENCHMARKS[name](row_count)
+    seconds = min(repeat(func, number=1, repeat=repeat_count))
+    # Tracing slows everything down, so memory is measured in a run of its own
+    tracemalloc.start()
+    try:
+        func()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return BenchmarkResult(name, row_count, seconds, peak_memory)
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            check=True,
+            text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_results(path: Path) -> dict[tuple[str, int], BenchmarkResult]:
+    with open(path) as f:
+        data = json.load(f)
+    return {
+        (result["name"], result["rows"]): BenchmarkResult(**result) for result in data["results"]
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROW_COUNTS)
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, help="Save the results as JSON to this file")
+    parser.add_argument(
+        "--compare", type=Path, help="Compare the results with those saved in this file"
+    )
+    args = parser.parse_args()
+    baseline = load_results(args.compare) if args.compare else {}
+    results = []
+    print(f"Best of {args.repeat}:")
+    for name in args.only:
+        for row_count in args.rows:
+            result = measure(name, row_count, args.repeat)
+            results.append(result)
+            line = "  {:<22} {:>6} rows {:10.1f} ms {:12.0f} rows/s {:10.1f} KiB peak".format(
+                name,
+                row_count,
+                result.seconds * 1000,
+                result.rows_per_second,
+                result.peak_memory / 1024
+            )
+            previous = baseline.get((name, row_count))
+            if previous is not None:
+                line += "  ({:+.0%} time, {:+.0%} memory)".format(
+                    result.seconds / previous.seconds - 1,
+                    result.peak_memory / previous.peak_memory - 1 if previous.peak_memory else 0
+                )
+            print(line)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "commit": get_commit(),
+                "python": platform.python_version(),
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "results": [asdict(result) for result in results]
+            }, f, indent=2)
+        print(f"Saved results to {args.output}")
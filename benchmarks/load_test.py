@@ -0,0 +1,79 @@
+"""
+Scrapes a range of days from a local stand-in for the police activity log
+(``tests.fake_police_log``) over real sockets, and reports the request rate
+and end-to-end time.
+
+Usage: python -m benchmarks.load_test [--days N] [--rows N] [--latency S]
+    [--latency-jitter S] [--error-rate F] [--max-concurrent-requests N]
+    [--max-concurrent-days N] [--stream-detail-pages]
+"""
+import asyncio, logging
+from argparse import ArgumentParser
+from datetime import date, timedelta
+
+from icbot.config import settings
+from scraper import fetch_dispatch_entries_for_date_range, Scraper
+from tests.fake_police_log import FakePoliceLog
+
+
+async def run_load_test(args) -> None:
+    fake_police_log = FakePoliceLog(
+        rows_per_day=args.rows,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        seed=0
+    )
+    through_date = date(2023, 2, 28)
+    from_date = through_date - timedelta(days=args.days - 1)
+    async with fake_police_log.serve() as url:
+        with settings.override({
+            "POLICE_LOG_URL": url,
+            "STREAM_DETAIL_PAGES": args.stream_detail_pages
+        }):
+            scraper = Scraper(
+                max_concurrent_requests=args.max_concurrent_requests,
+                # The fake site doesn't need protecting
+                requests_per_second_per_host=0
+            )
+            loop = asyncio.get_running_loop()
+            started_at = loop.time()
+            entry_sets = await fetch_dispatch_entries_for_date_range(
+                from_date,
+                through_date,
+                max_concurrent_days=args.max_concurrent_days,
+                scraper=scraper
+            )
+            seconds = loop.time() - started_at
+    entries = [entry for entry_set in entry_sets for entry in entry_set.entries]
+    stats = scraper.stats
+    print(f"Scraped {args.days} day(s) of {args.rows} row(s) in {seconds:.2f}s")
+    print("  Requests served:  {} ({:.0f}/s), {} of them errors".format(
+        fake_police_log.requests, fake_police_log.requests / seconds, fake_police_log.errors
+    ))
+    print("  Entries kept:     {} ({} with errors)".format(
+        len(entries), sum(1 for entry in entries if entry.error)
+    ))
+    print("  Queue wait:       {:.1f} ms mean, {:.1f} ms max".format(
+        stats.queue_wait_mean * 1000, stats.queue_wait_max * 1000
+    ))
+    print(f"  Retries:          {stats.retries} ({stats.failures} failed for good)")
+    print(f"  Connection reuse: {stats.connection_reuse_rate:.0%}")
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--latency-jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--max-concurrent-requests", type=int, default=settings.MAX_CONCURRENT_REQUESTS
+    )
+    parser.add_argument("--max-concurrent-days", type=int, default=settings.MAX_CONCURRENT_DAYS)
+    parser.add_argument("--stream-detail-pages", action="store_true")
+    args = parser.parse_args()
+    # Per-request logging would swamp the report
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+    asyncio.run(run_load_test(args))
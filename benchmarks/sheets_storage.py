@@ -0,0 +1,101 @@
+"""
+Measures the Google Sheets API calls (and their payloads) made by
+``GoogleSheetsStorage`` when storing, pruning and reading back entries, using
+an in-process stand-in for the API (``tests.fake_google_sheets``).
+
+Usage: python -m benchmarks.sheets_storage [--days N] [--rows N]
+    [--maximum-sheet-count N] [--rate-limit-error-rate F] [--one-by-one]
+"""
+from argparse import ArgumentParser
+from datetime import date, timedelta
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from unittest.mock import patch
+
+from icbot.config import settings
+from scraper import DispatchEntrySet
+from storage.google_sheets import GoogleSheetsStorage
+from tests.fake_google_sheets import FakeSheetsService
+from tests.test_sqlite_storage import make_entry
+
+
+def report(label: str, service: FakeSheetsService, seconds: float, backoff: float):
+    print(f"{label} ({seconds * 1000:.1f} ms, plus {backoff:.1f}s of backoff):")
+    for method, calls in sorted(service.calls.items()):
+        print("  {:<12} {:4} call(s) {:10.1f} KiB sent {:10.1f} KiB received {:4} limited".format(
+            method,
+            calls,
+            service.request_bytes[method] / 1024,
+            service.response_bytes[method] / 1024,
+            service.rate_limit_errors[method]
+        ))
+    service.reset_counts()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--maximum-sheet-count", type=int, default=20)
+    parser.add_argument("--rate-limit-error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--one-by-one",
+        action="store_true",
+        help="Store each day with its own store_entries() call rather than all at once"
+    )
+    args = parser.parse_args()
+    service = FakeSheetsService(rate_limit_error_rate=args.rate_limit_error_rate, seed=0)
+    service.add_sheet({"sheetId": 0, "title": "Sheet1"})
+    through_date = date(2023, 2, 28)
+    entry_sets = [
+        DispatchEntrySet(
+            date=through_date - timedelta(days=day),
+            entries=[make_entry(day * args.rows + i) for i in range(args.rows)]
+        ) for day in reversed(range(args.days))
+    ]
+    backoff = 0.0
+
+    def sleep(seconds: float):
+        # Backoff is tallied rather than waited out
+        global backoff
+        backoff += seconds
+
+    with TemporaryDirectory() as data_dir, settings.override({"DATA_DIR": data_dir}), \
+            patch("storage.google_sheets.time.sleep", side_effect=sleep):
+        storage = GoogleSheetsStorage(
+            spreadsheet_id="benchmark",
+            client_secrets_file="",
+            maximum_sheet_count=args.maximum_sheet_count,
+            service=service
+        )
+        started_at = perf_counter()
+        if args.one_by_one:
+            for entry_set in entry_sets:
+                storage.store_entries(entry_set)
+        else:
+            storage.store_entry_sets(entry_sets)
+        report(
+            f"Stored {args.days} day(s) of {args.rows} row(s)",
+            service,
+            perf_counter() - started_at,
+            backoff
+        )
+        backoff = 0.0
+        started_at = perf_counter()
+        storage.prune()
+        report("Pruned", service, perf_counter() - started_at, backoff)
+        backoff = 0.0
+        # A fresh instance, as at the start of the next run
+        storage = GoogleSheetsStorage(
+            spreadsheet_id="benchmark",
+            client_secrets_file="",
+            service=service
+        )
+        started_at = perf_counter()
+        latest_date, dispatch_ids = storage.get_latest_date_with_dispatch_ids()
+        report(
+            f"Read {len(dispatch_ids)} ID(s) from {latest_date}",
+            service,
+            perf_counter() - started_at,
+            backoff
+        )
@@ -1,16 +1,22 @@
 from dataclasses import dataclass
-from typing import Optional
+from html.parser import HTMLParser
+from typing import Any, Optional
 from urllib.parse import urljoin
 
 from bs4 import BeautifulSoup, Tag
 
 from icbot.config import settings
+from icbot.config.filters import FilterMatch
 
 
 class UnexpectedPageLayout(ValueError):
     pass
 
 
+class StopParsing(Exception):
+    pass
+
+
 @dataclass
 class BlotterEntry:
     dispatch_number: int
@@ -23,68 +29,244 @@ class BlotterEntry:
 
     @classmethod
     def from_page(cls, page: BeautifulSoup) -> list["BlotterEntry"]:
-        entries = []
-        expected_headers = {
-            "dispatch number",
-            "address",
-            "activity",
-            "disposition",
-            "details"
-        }
-        observed_headers = [None if tag.string is None else tag.string.lower() for tag in page.thead.find_all("th")]
-        missing_headers = expected_headers & (expected_headers ^ set(observed_headers))
-        if missing_headers:
-            raise UnexpectedPageLayout(
-                "Did not find following expected page header(s): {}".format(
-                    ", ".join(missing_headers)
-                )
-            )
-        header_indices = {h: i for i, h in enumerate(observed_headers)}
-        for i, table_row in enumerate(page.tbody.find_all("tr")):
-            cells = table_row.find_all("td")
-            try:
-                url = urljoin(
-                    settings.POLICE_LOG_URL,
-                    cells[header_indices["dispatch number"]].find("a")["href"]
-                )
-            except (TypeError, KeyError, IndexError):
-                raise UnexpectedPageLayout(
-                    f"Could not parse dispatch URL from row {i + 1}"
-                )
-            entries.append(cls(
-                dispatch_number=int(cells[header_indices["dispatch number"]].string),
-                url=url,
-                activity=cells[header_indices["activity"]].string,
-                disposition=cells[header_indices["disposition"]].string,
-                has_details=cells[header_indices["details"]].string.strip().lower() == "y"
-            ))
-        return entries
+        return [cls(**fields) for fields in get_blotter_rows(page, settings.POLICE_LOG_URL)]
 
     @property
     def exclude(self) -> bool:
         if not self.has_details:
             return True
+        return self.exclusion_rule is not None
+
+    @property
+    def exclusion_rule(self) -> Optional[FilterMatch]:
         if self.has_details and self.details is not None:
             if self.details:
                 # These have already been filtered by activity/disposition, no need
                 # to do so again.
-                return any(
-                    pattern.search(self.details) for pattern in settings.BLOCKING_FILTERS["DETAILS"]
-                )
-            return False
-        return any(
-            pattern.search(self.activity or "") for pattern in settings.BLOCKING_FILTERS["ACTIVITIES"]
-        ) or any(
-            pattern.search(self.disposition or "") for pattern in settings.BLOCKING_FILTERS["DISPOSITIONS"]
-        )
+                return settings.BLOCKING_FILTERS.match("DETAILS", self.details)
+            return None
+        return settings.BLOCKING_FILTERS.match_summary(self.activity or "", self.disposition or "")
 
     def set_details_from_page(self, page: BeautifulSoup):
-        found_details_label = False
-        for element in filter(lambda node: isinstance(node, Tag), page.dl):
-            if found_details_label and element.name == "dd":
-                self.details = element.string.strip()
-                break
-            if element.name == "dt" and element.string.strip().lower() == "details":
-                found_details_label = True
+        self.details = get_details(page)
+
+
+# The functions below deal only in markup and plain values (rather than
+# BlotterEntry instances or settings) so that they may be run in a worker
+# process.
+
+def get_string(tag: Tag) -> Optional[str]:
+    # Plain strings don't keep the rest of the parse tree alive (and pickle
+    # cheaply)
+    return None if tag.string is None else str(tag.string)
+
+
+def get_blotter_rows(page: BeautifulSoup, base_url: str) -> list[dict[str, Any]]:
+    table_rows = []
+    for table_row in page.tbody.find_all("tr"):
+        cells = []
+        for cell in table_row.find_all("td"):
+            anchor = cell.find("a")
+            cells.append((get_string(cell), None if anchor is None else anchor.get("href")))
+        table_rows.append(cells)
+    return build_blotter_rows(
+        [get_string(tag) for tag in page.thead.find_all("th")],
+        table_rows,
+        base_url
+    )
+
+
+def build_blotter_rows(
+    observed_headers: list[Optional[str]],
+    table_rows: list[list[tuple[Optional[str], Optional[str]]]],
+    base_url: str
+) -> list[dict[str, Any]]:
+    """
+    Validates the blotter table headers and returns a dict of ``BlotterEntry``
+    fields for each row, where each row is given as a list of (text, link)
+    pairs, one per cell.
+    """
+    rows = []
+    expected_headers = {
+        "dispatch number",
+        "address",
+        "activity",
+        "disposition",
+        "details"
+    }
+    observed_headers = [None if header is None else header.lower() for header in observed_headers]
+    missing_headers = expected_headers & (expected_headers ^ set(observed_headers))
+    if missing_headers:
+        raise UnexpectedPageLayout(
+            "Did not find following expected page header(s): {}".format(
+                ", ".join(missing_headers)
+            )
+        )
+    header_indices = {h: i for i, h in enumerate(observed_headers)}
+    for i, cells in enumerate(table_rows):
+        try:
+            dispatch_number, href = cells[header_indices["dispatch number"]]
+            if href is None:
+                raise TypeError
+            url = urljoin(base_url, href)
+        except (TypeError, IndexError):
+            raise UnexpectedPageLayout(
+                f"Could not parse dispatch URL from row {i + 1}"
+            )
+        rows.append({
+            "dispatch_number": int(dispatch_number),
+            "url": url,
+            "activity": cells[header_indices["activity"]][0],
+            "disposition": cells[header_indices["disposition"]][0],
+            "has_details": cells[header_indices["details"]][0].strip().lower() == "y"
+        })
+    return rows
+
+
+class BlotterTableParser(HTMLParser):
+    """
+    Collects the header and cell contents of the blotter table without
+    building a document tree. Only the first ``<thead>`` and ``<tbody>`` are
+    read, mirroring ``get_blotter_rows()``, and tokenizing stops (by raising
+    ``StopParsing``) at the end of the latter.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.headers: Optional[list[Optional[str]]] = None
+        self.rows: Optional[list[list[tuple[Optional[str], Optional[str]]]]] = None
+        self._section = None
+        self._row = None
+        self._cell_text = None
+        self._cell_href = None
+        self._cell_has_anchor = False
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, Optional[str]]]):
+        if tag == "thead" and self.headers is None:
+            self._section = tag
+            self.headers = []
+        elif tag == "tbody" and self.rows is None:
+            self._section = tag
+            self.rows = []
+        elif self._section == "thead":
+            if tag == "th":
+                self._cell_text = []
+        elif self._section == "tbody":
+            if tag == "tr":
+                self._row = []
+                self.rows.append(self._row)
+            elif tag == "td" and self._row is not None:
+                self._cell_text = []
+                self._cell_href = None
+                self._cell_has_anchor = False
+            elif tag == "a" and self._cell_text is not None and not self._cell_has_anchor:
+                self._cell_has_anchor = True
+                self._cell_href = dict(attrs).get("href")
+
+    def handle_endtag(self, tag: str):
+        if tag == self._section:
+            self._section = None
+            self._row = None
+            if tag == "tbody":
+                raise StopParsing
+        elif tag == "th" and self._section == "thead" and self._cell_text is not None:
+            self.headers.append("".join(self._cell_text) or None)
+            self._cell_text = None
+        elif tag == "td" and self._row is not None and self._cell_text is not None:
+            self._row.append(("".join(self._cell_text) or None, self._cell_href))
+            self._cell_text = None
+        elif tag == "tr":
+            self._row = None
+
+    def handle_data(self, data: str):
+        if self._cell_text is not None:
+            self._cell_text.append(data)
+
+
+def get_details(page: BeautifulSoup) -> str:
+    found_details_label = False
+    for element in filter(lambda node: isinstance(node, Tag), page.dl or []):
+        if found_details_label and element.name == "dd":
+            return element.string.strip()
+        if element.name == "dt" and element.string.strip().lower() == "details":
+            found_details_label = True
+    raise UnexpectedPageLayout("Could not find details on page")
+
+
+class DetailsExtractor(HTMLParser):
+    """
+    Incrementally extracts the value of the "Details" field from a dispatch
+    detail page. Markup may be passed to ``feed()`` in as many chunks as
+    needed; it returns ``True`` once the value has been found, after which
+    nothing more need be fed. ``close()`` returns the value, mirroring
+    ``get_details()``.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.details: Optional[str] = None
+        self._in_list = False
+        self._list_seen = False
+        self._field_text = None
+        self._found_details_label = False
+
+    def feed(self, data: str) -> bool:
+        if self.details is None:
+            try:
+                super().feed(data)
+            except StopParsing:
+                pass
+        return self.details is not None
+
+    def close(self) -> str:
+        if self.details is None:
+            try:
+                super().close()
+            except StopParsing:
+                pass
         if self.details is None:
             raise UnexpectedPageLayout("Could not find details on page")
+        return self.details
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, Optional[str]]]):
+        if tag == "dl" and not self._list_seen:
+            self._in_list = self._list_seen = True
+        elif self._in_list and tag in ("dt", "dd"):
+            self._field_text = []
+
+    def handle_endtag(self, tag: str):
+        if not self._in_list:
+            return
+        if tag == "dl":
+            # Only the first list is considered
+            self._in_list = False
+            raise StopParsing
+        if tag == "dt" and self._field_text is not None:
+            if "".join(self._field_text).strip().lower() == "details":
+                self._found_details_label = True
+            self._field_text = None
+        elif tag == "dd" and self._field_text is not None:
+            if self._found_details_label:
+                self.details = "".join(self._field_text).strip()
+                raise StopParsing
+            self._field_text = None
+
+    def handle_data(self, data: str):
+        if self._field_text is not None:
+            self._field_text.append(data)
+
+
+def parse_blotter_page(html: str, base_url: str) -> list[dict[str, Any]]:
+    table_parser = BlotterTableParser()
+    try:
+        table_parser.feed(html)
+        table_parser.close()
+    except StopParsing:
+        pass
+    if table_parser.rows is None:
+        raise UnexpectedPageLayout("Could not find the blotter table body")
+    return build_blotter_rows(table_parser.headers or [], table_parser.rows, base_url)
+
+
+def parse_details_page(html: str) -> str:
+    extractor = DetailsExtractor()
+    extractor.feed(html)
+    return extractor.close()
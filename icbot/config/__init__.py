@@ -7,10 +7,11 @@ from importlib import import_module
 from logging import getLogger, StreamHandler
 from logging.config import dictConfig
 from pathlib import Path
-from typing import Any, Union
+from typing import Any, Iterable, Optional, Union
 from zoneinfo import ZoneInfo
 
 from storage.base import BaseStorage, get_concrete_storage
+from .filters import BlockingFilters
 
 
 class ConfigurationError(ValueError):
@@ -46,7 +47,7 @@ class Settings:
         self._set_from_module("icbot.config.defaults")
         dictConfig(self.LOGGING)
 
-    def validate_blocking_filters(self, setting_value: dict[str, Any]) -> dict[str, Any]:
+    def validate_blocking_filters(self, setting_value: dict[str, Any]) -> BlockingFilters:
         for block_type, blocks in setting_value.items():
             for i, block in enumerate(blocks):
                 if isinstance(blocks[i], re.Pattern):
@@ -57,6 +58,11 @@ class Settings:
                     raise ConfigurationError(
                         f"Error parsing regular expression '{block}'"
                     ) from e
+        return BlockingFilters(setting_value)
+
+    def validate_daemon_poll_interval(self, setting_value: float) -> float:
+        if setting_value <= 0:
+            raise ConfigurationError("The DAEMON_POLL_INTERVAL setting must be positive")
         return setting_value
 
     def validate_data_dir(self, setting_value: Union[str, Path]) -> Path:
@@ -68,6 +74,37 @@ class Settings:
             )
         return setting_value
 
+    def validate_hedge_percentile(self, setting_value: Optional[float]) -> Optional[float]:
+        if setting_value is not None and not 0 < setting_value < 100:
+            raise ConfigurationError(
+                "The HEDGE_PERCENTILE setting must be between 0 and 100 (exclusive) or None"
+            )
+        return setting_value
+
+    def validate_metrics_format(self, setting_value: Optional[str]) -> Optional[str]:
+        if setting_value not in (None, "prometheus", "json"):
+            raise ConfigurationError(
+                "The METRICS_FORMAT setting must be one of 'prometheus', 'json' or None"
+            )
+        return setting_value
+
+    def validate_parser_executor(self, setting_value: Optional[str]) -> Optional[str]:
+        if setting_value not in (None, "process", "thread"):
+            raise ConfigurationError(
+                "The PARSER_EXECUTOR setting must be one of 'process', 'thread' or None"
+            )
+        return setting_value
+
+    def validate_request_max_attempts(self, setting_value: int) -> int:
+        if not isinstance(setting_value, int) or setting_value < 1:
+            raise ConfigurationError(
+                "The REQUEST_MAX_ATTEMPTS setting must be a positive integer"
+            )
+        return setting_value
+
+    def validate_request_retry_statuses(self, setting_value: Iterable[int]) -> frozenset[int]:
+        return frozenset(setting_value)
+
     def validate_storage(self, setting_value: Any) -> dict[str, Any]:
         if not setting_value:
             raise ConfigurationError("The STORAGE setting is required")
@@ -81,6 +118,13 @@ class Settings:
             )
         return setting_value
 
+    def validate_storage_batch_days(self, setting_value: int) -> int:
+        if not isinstance(setting_value, int) or setting_value < 1:
+            raise ConfigurationError(
+                "The STORAGE_BATCH_DAYS setting must be a positive integer"
+            )
+        return setting_value
+
     @contextmanager
     def override(self, overrides: dict[str, Any]):
         prev = {k: v for k, v in self.__dict__.items() if k.isupper()}
@@ -4,6 +4,99 @@ from pathlib import Path
 TIME_ZONE = "America/Chicago"
 POLICE_LOG_URL = "https://www.iowa-city.org/IcgovApps/police/ActivityLog"
 POLICE_LOG_DATETIME_FORMAT = "%-m/%-d/%Y"
+# The maximum number of days whose activity logs are fetched concurrently when
+# scraping a date range
+MAX_CONCURRENT_DAYS = 4
+# The maximum number of scraped days held back to be stored together, for
+# storage that batches its writes; a batch is also stored early if it would
+# grow too large for a single write
+STORAGE_BATCH_DAYS = 7
+# Keyword arguments for the scraper's aiohttp.TCPConnector, which keeps idle
+# connections open for "keepalive_timeout" seconds for reuse by later requests
+# and caches DNS lookups for "ttl_dns_cache" seconds
+HTTP_CONNECTOR = {
+    "limit": 32,
+    "limit_per_host": 8,
+    "keepalive_timeout": 30,
+    "ttl_dns_cache": 300
+}
+# Keyword arguments for the aiohttp.ClientTimeout applied to every request, in
+# seconds; None means no limit
+HTTP_TIMEOUT = {
+    "total": 120,
+    "connect": 15,
+    "sock_read": 60
+}
+# The content codings the scraper offers to accept, in order of preference;
+# "br" is only offered if the brotli package (which aiohttp needs in order to
+# decode it) is installed
+HTTP_ACCEPT_ENCODINGS = ["br", "gzip", "deflate"]
+# Limits applied to every request issued by the scraper; set either to None to
+# disable it
+MAX_CONCURRENT_REQUESTS = 8
+MAX_REQUESTS_PER_SECOND_PER_HOST = 10
+# HTML parsing may be offloaded from the event loop to a "process" or "thread"
+# pool; if None, pages are parsed inline
+PARSER_EXECUTOR = None
+PARSER_EXECUTOR_MAX_WORKERS = None
+# GET requests that fail with a connection error, a timeout or one of
+# REQUEST_RETRY_STATUSES are retried until REQUEST_MAX_ATTEMPTS attempts have
+# been made in all. Before attempt n, the scraper waits for a random interval
+# of up to REQUEST_RETRY_BACKOFF * 2 ** (n - 2) seconds (capped at
+# REQUEST_RETRY_BACKOFF_MAX), or for as long as the response's Retry-After
+# header asks if it has one; a request is not retried if the server asks for a
+# longer wait than REQUEST_RETRY_BACKOFF_MAX. Set REQUEST_MAX_ATTEMPTS to 1 to
+# disable retries.
+REQUEST_MAX_ATTEMPTS = 4
+REQUEST_RETRY_BACKOFF = 0.5
+REQUEST_RETRY_BACKOFF_MAX = 30
+REQUEST_RETRY_STATUSES = [429, 500, 502, 503, 504]
+# Detail pages still outstanding DAY_DEADLINE seconds after the scrape of a day
+# began are abandoned, and their entries marked with an error; set to None for
+# no deadline. Individual requests are limited by HTTP_TIMEOUT.
+DAY_DEADLINE = 600
+# If set, a GET request still in flight after this percentile of recent request
+# latencies (of which there must be at least HEDGE_MIN_SAMPLES) is duplicated,
+# and whichever response arrives first is used
+HEDGE_PERCENTILE = None
+HEDGE_MIN_SAMPLES = 20
+# After CIRCUIT_BREAKER_THRESHOLD consecutive failed attempts (as above) to
+# reach a host, requests to it fail immediately for
+# CIRCUIT_BREAKER_RESET_TIMEOUT seconds, after which a single trial request is
+# let through to see whether it has recovered. Set CIRCUIT_BREAKER_THRESHOLD
+# to None to disable.
+CIRCUIT_BREAKER_THRESHOLD = 5
+CIRCUIT_BREAKER_RESET_TIMEOUT = 60
+# If True, detail pages are parsed straight off the response stream as they're
+# downloaded (bypassing PARSER_EXECUTOR) and the rest of the body is discarded
+# once the details have been found
+STREAM_DETAIL_PAGES = False
+# Dispatch detail pages are cached under DATA_DIR; cached pages older than "ttl"
+# seconds are revalidated with the server before use, and the least recently
+# used pages are evicted once the cache exceeds "max_size" bytes. Set to None to
+# disable caching.
+HTTP_CACHE = {
+    "ttl": 7 * 24 * 60 * 60,
+    "max_size": 256 * 1024 * 1024
+}
+# If True, a fingerprint of each date's activity log is kept under DATA_DIR
+# once its entries have been stored, and later runs skip the date entirely if
+# the page hasn't changed since
+TRACK_ACTIVITY_LOG_CHANGES = True
+# If True, the dispatch numbers of all stored entries are kept in an index under
+# DATA_DIR, and dispatches already in it are skipped on any date (rather than
+# just those from the latest stored date)
+TRACK_SEEN_DISPATCH_IDS = True
+# At the end of each run, timings and counts for each stage of it are written to
+# DATA_DIR as icbot_metrics.prom (in the Prometheus text format, for
+# node_exporter's textfile collector) if "prometheus", or as icbot_metrics.json
+# if "json". Set to None to disable.
+METRICS_FORMAT = "prometheus"
+# In daemon mode (run.py --daemon), today's activity log is polled every
+# DAEMON_POLL_INTERVAL seconds, give or take up to DAEMON_POLL_JITTER seconds
+# at random
+DAEMON_POLL_INTERVAL = 5 * 60
+DAEMON_POLL_JITTER = 30
 BLOCKING_FILTERS = {
     "ACTIVITIES": [
         "MVA/PROPERTY DAMAGE ACCIDENT",
@@ -70,6 +163,16 @@ DATA_DIR = Path(__file__).parent.parent.parent / "data"
 #         "client_secrets_file": "/path/to/file.json"
 #     }
 # }
+#
+# or, to keep entries in a local database (by default, icbot.sqlite3 under
+# DATA_DIR):
+#
+# STORAGE = {
+#     "class": "storage.SQLiteStorage",
+#     "init_kwargs": {
+#         "retention_days": 365
+#     }
+# }
 STORAGE = None
 
 EMAIL_FROM_ADDRESS = "icbot@localhost"
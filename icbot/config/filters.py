@@ -0,0 +1,94 @@
+import re
+from collections import OrderedDict
+from typing import Iterable, NamedTuple, Optional
+
+# Patterns that refer to their own groups can't be renumbered into a combined
+# expression, so they are searched on their own
+GROUP_REFERENCE_PATTERN = re.compile(r"\\[1-9]|\(\?P=")
+
+
+class FilterMatch(NamedTuple):
+    category: str
+    pattern: re.Pattern
+
+    def __str__(self) -> str:
+        return f"{self.category} filter '{self.pattern.pattern}'"
+
+
+class CategoryMatcher:
+    """
+    Searches a string against a list of patterns in as few passes as possible
+    by combining patterns that share flags into one alternation, with a named
+    group per pattern so that the one that matched can be reported.
+    """
+    def __init__(self, patterns: Iterable[re.Pattern]):
+        self.patterns = list(patterns)
+        self.combined: list[tuple[re.Pattern, dict[str, re.Pattern]]] = []
+        self.standalone: list[re.Pattern] = []
+        patterns_by_flags: dict[int, list[re.Pattern]] = {}
+        for pattern in self.patterns:
+            if pattern.groupindex or GROUP_REFERENCE_PATTERN.search(pattern.pattern):
+                self.standalone.append(pattern)
+            else:
+                patterns_by_flags.setdefault(pattern.flags, []).append(pattern)
+        for flags, patterns in patterns_by_flags.items():
+            group_patterns = {f"p{i}": pattern for i, pattern in enumerate(patterns)}
+            try:
+                combined = re.compile(
+                    "|".join(f"(?P<{name}>{pattern.pattern})" for name, pattern in group_patterns.items()),
+                    flags
+                )
+            except re.error:
+                # E.g. a pattern with inline global flags, which must come first
+                self.standalone.extend(patterns)
+            else:
+                self.combined.append((combined, group_patterns))
+
+    def search(self, value: str) -> Optional[re.Pattern]:
+        for combined, group_patterns in self.combined:
+            match = combined.search(value)
+            if match:
+                # The outermost group is the last to close, so this is always
+                # one of ours
+                return group_patterns[match.lastgroup]
+        for pattern in self.standalone:
+            if pattern.search(value):
+                return pattern
+        return None
+
+
+class BlockingFilters(dict):
+    """
+    The validated form of the ``BLOCKING_FILTERS`` setting: still a dict of
+    compiled patterns by category, but with a ``CategoryMatcher`` per category
+    and a bounded cache of decisions on activity/disposition pairs (which
+    repeat a great deal from one entry to the next).
+    """
+    CACHE_SIZE = 4096
+
+    def __init__(self, filters: dict[str, list[re.Pattern]]):
+        super().__init__(filters)
+        self.matchers = {category: CategoryMatcher(patterns) for category, patterns in self.items()}
+        self._decisions: OrderedDict[tuple[str, str], Optional[FilterMatch]] = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def match(self, category: str, value: str) -> Optional[FilterMatch]:
+        matcher = self.matchers.get(category)
+        pattern = matcher.search(value) if matcher else None
+        return None if pattern is None else FilterMatch(category, pattern)
+
+    def match_summary(self, activity: str, disposition: str) -> Optional[FilterMatch]:
+        key = (activity, disposition)
+        try:
+            decision = self._decisions[key]
+        except KeyError:
+            self.cache_misses += 1
+            decision = self.match("ACTIVITIES", activity) or self.match("DISPOSITIONS", disposition)
+            self._decisions[key] = decision
+            if len(self._decisions) > self.CACHE_SIZE:
+                self._decisions.popitem(last=False)
+        else:
+            self.cache_hits += 1
+            self._decisions.move_to_end(key)
+        return decision
@@ -1,39 +1,385 @@
 #!/usr/bin/env python
-import asyncio, logging
+import asyncio, logging, random, signal, time
 from argparse import ArgumentParser
+from contextlib import aclosing, nullcontext
+from dataclasses import asdict, dataclass
 from datetime import date, timedelta
+from typing import Container, Optional, Union
 
 from icbot.config import settings
-from scraper import fetch_dispatch_entries, fetch_dispatch_entries_for_date_range
-from storage.base import BaseStorage
+from scraper import (
+    DispatchEntrySet, fetch_dispatch_entries, iter_dispatch_entries_for_date_range, Scraper
+)
+from storage.base import AsyncBaseStorage, BaseStorage, get_async_storage
+from utils.http_cache import ResponseCache
+from utils.metrics import Metrics
+from utils.page_fingerprints import PageFingerprints
+from utils.profiling import RunProfiler
+from utils.seen_ids import SeenDispatchIndex
 
 logger = logging.getLogger(__name__)
 
-def fill_through_date(through_date: date, storage: BaseStorage):
-    latest_date, id_list = storage.get_latest_date_with_dispatch_ids()
+def record_stored_entry_sets(
+    entry_sets: list[DispatchEntrySet],
+    seen_ids: Optional[SeenDispatchIndex] = None,
+    fingerprints: Optional[PageFingerprints] = None
+):
+    for entry_set in entry_sets:
+        logger.debug("Stored %s entries for %s", len(entry_set.entries), entry_set.date)
+        if seen_ids is not None:
+            seen_ids.update(entry.dispatch_number for entry in entry_set.entries)
+        if fingerprints is not None and entry_set.fingerprint is not None:
+            fingerprints.record(entry_set.date, entry_set.fingerprint)
+    if seen_ids is not None:
+        seen_ids.save()
+    if fingerprints is not None:
+        fingerprints.save()
+
+async def fill_through_date_async(
+    through_date: date,
+    storage: AsyncBaseStorage,
+    scraper: Optional[Scraper] = None,
+    seen_ids: Optional[SeenDispatchIndex] = None,
+    prune: bool = False
+):
+    """
+    Scrapes each day from the latest stored one through ``through_date`` and
+    stores it as soon as it (and every day before it) is ready, while later
+    days are still being scraped. Days are stored in date order, and memory
+    use is bounded by ``MAX_CONCURRENT_DAYS`` however long the range. If the
+    storage's ``batch_writes`` is set, days are instead held back and stored
+    several at a time, so memory use is also bounded by
+    ``STORAGE_BATCH_DAYS`` and the storage's ``maximum_write_size``. Pruning
+    goes along with the last write.
+    """
+    latest_date, id_list = await storage.get_latest_date_with_dispatch_ids()
+    if latest_date is None:
+        # Nothing has been stored yet
+        latest_date = through_date
+    if scraper is None:
+        scraper = Scraper()
     if latest_date > through_date:
+        if prune:
+            with scraper.metrics.timer("prune"):
+                await storage.prune()
         return
-    entry_sets = asyncio.run(fetch_dispatch_entries_for_date_range(
-        latest_date,
-        through_date,
-        skip_ids=id_list
-    ))
-    for entry_set in entry_sets:
-        storage.store_entries(entry_set)
+    if seen_ids is not None:
+        seen_ids.update(id_list)
+    skip_ids = id_list if seen_ids is None else seen_ids
+    # Scraped days wait here for the storage to catch up; iteration (and so
+    # scraping) pauses while the queue is full
+    queue: asyncio.Queue[Union[DispatchEntrySet, Exception, None]] = asyncio.Queue(maxsize=1)
+
+    async def produce():
+        try:
+            async with aclosing(iter_dispatch_entries_for_date_range(
+                latest_date, through_date, skip_ids, scraper=scraper
+            )) as entry_sets:
+                async for entry_set in entry_sets:
+                    await queue.put(entry_set)
+            await queue.put(None)
+        except Exception as e:
+            await queue.put(e)
+
+    async def store(entry_sets: list[DispatchEntrySet], prune: bool = False):
+        with scraper.metrics.timer("store_entries"):
+            await storage.store_entry_sets(entry_sets, prune=prune)
+        scraper.metrics.increment("entries_stored", sum(
+            len(entry_set.entries) for entry_set in entry_sets
+        ))
+        record_stored_entry_sets(entry_sets, seen_ids, scraper.fingerprints)
+
+    async def consume():
+        # Days scraped but not yet stored. Storage that batches its writes gets
+        # up to STORAGE_BATCH_DAYS at a time, fewer if more wouldn't fit in one
+        # write
+        entry_sets: list[DispatchEntrySet] = []
+        write_size = 0
+        while True:
+            items = [await queue.get()]
+            # Days that are already waiting are stored along with it
+            while isinstance(items[-1], DispatchEntrySet) and not queue.empty():
+                items.append(queue.get_nowait())
+            for item in items:
+                if not isinstance(item, DispatchEntrySet) or item.unchanged:
+                    continue
+                if storage.batch_writes:
+                    # A full batch is only stored once there's another day to
+                    # follow it, so that pruning can go along with the last
+                    item_size = storage.get_write_size(item)
+                    if entry_sets and (
+                        len(entry_sets) >= settings.STORAGE_BATCH_DAYS
+                        or write_size + item_size > storage.maximum_write_size
+                    ):
+                        await store(entry_sets)
+                        entry_sets = []
+                        write_size = 0
+                    write_size += item_size
+                entry_sets.append(item)
+            if isinstance(items[-1], Exception):
+                # What was scraped before the failure is still stored
+                if entry_sets:
+                    await store(entry_sets)
+                raise items[-1]
+            if items[-1] is None:
+                if entry_sets:
+                    # Pruning goes along with the last write
+                    await store(entry_sets, prune=prune)
+                elif prune:
+                    with scraper.metrics.timer("prune"):
+                        await storage.prune()
+                return
+            if entry_sets and not storage.batch_writes:
+                await store(entry_sets)
+                entry_sets = []
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        await consume()
+    finally:
+        producer.cancel()
+
+
+def fill_through_date(
+    through_date: date,
+    storage: Union[BaseStorage, AsyncBaseStorage],
+    scraper: Optional[Scraper] = None,
+    seen_ids: Optional[SeenDispatchIndex] = None,
+    prune: bool = False
+):
+    async def run():
+        async_storage = get_async_storage(storage)
+        try:
+            await fill_through_date_async(through_date, async_storage, scraper, seen_ids, prune)
+        finally:
+            if async_storage is not storage:
+                await async_storage.close()
+
+    asyncio.run(run())
+
+
+def profile_run(
+    through_date: date,
+    storage: Union[BaseStorage, AsyncBaseStorage],
+    scraper: Optional[Scraper] = None,
+    seen_ids: Optional[SeenDispatchIndex] = None,
+    slow_callback_duration: float = 0.05
+):
+    """
+    Like ``fill_through_date(..., prune=True)``, but profiled, with the report
+    and raw profiles written to a new directory under ``DATA_DIR/profiles``.
+    """
+    profiler = RunProfiler(
+        settings.DATA_DIR / "profiles" / time.strftime("%Y%m%d-%H%M%S"),
+        slow_callback_duration
+    )
+
+    async def run():
+        profiler.instrument(asyncio.get_running_loop())
+        # The same storage is used for both, as a synchronous one may only
+        # work from the thread it was first used on
+        async_storage = get_async_storage(storage)
+        try:
+            with profiler.profile("fill_through_date"):
+                await fill_through_date_async(through_date, async_storage, scraper, seen_ids)
+            with profiler.profile("prune"):
+                await async_storage.prune()
+        finally:
+            if async_storage is not storage:
+                await async_storage.close()
+
+    try:
+        asyncio.run(run(), debug=True)
+    finally:
+        logger.info("Wrote profiling report to %s", profiler.write_report())
+
+
+@dataclass
+class HighWaterMark:
+    """
+    The dispatch numbers up to and including ``value``, plus any in
+    ``others``, as ``skip_ids`` for polling a day's activity log for new
+    entries (dispatch numbers being assigned sequentially).
+    """
+    value: int
+    others: Optional[Container[int]] = None
+
+    def __contains__(self, dispatch_number: object) -> bool:
+        if isinstance(dispatch_number, int) and dispatch_number <= self.value:
+            return True
+        return self.others is not None and dispatch_number in self.others
+
+
+async def poll_date(
+    for_date: date,
+    storage: AsyncBaseStorage,
+    scraper: Scraper,
+    skip_ids: Container[int],
+    seen_ids: Optional[SeenDispatchIndex] = None
+) -> DispatchEntrySet:
+    entry_set = await fetch_dispatch_entries(for_date, skip_ids, scraper)
+    if entry_set.unchanged:
+        return entry_set
+    if entry_set.entries:
+        with scraper.metrics.timer("store_entries"):
+            await storage.store_entry_sets([entry_set])
+        scraper.metrics.increment("entries_stored", len(entry_set.entries))
+    # The page's fingerprint isn't recorded, as entries on it may have been
+    # skipped (by being below the high-water mark) without being stored, and
+    # the page would then count as unchanged when the day is finalized
+    record_stored_entry_sets([entry_set], seen_ids)
+    return entry_set
+
+
+async def run_daemon_async(
+    storage: AsyncBaseStorage,
+    scraper: Scraper,
+    seen_ids: Optional[SeenDispatchIndex] = None,
+    metrics: Optional[Metrics] = None,
+    stop_event: Optional[asyncio.Event] = None
+):
+    """
+    Polls today's activity log every ``DAEMON_POLL_INTERVAL`` seconds (give
+    or take ``DAEMON_POLL_JITTER``) until ``stop_event`` is set, storing the
+    entries of dispatches numbered above the highest yet listed. The scraper's
+    session and the storage, with their caches, are kept between polls.
+
+    On starting, and on the first poll after midnight (in ``TIME_ZONE``), the
+    days since the latest stored one are filled as by ``fill_through_date``,
+    which finalizes the previous day by storing any of its entries that
+    arrived late. Metrics are written after every poll.
+    """
+    if stop_event is None:
+        stop_event = asyncio.Event()
+    polled_date = None
+    high_water_mark = 0
+    async with scraper.session():
+        while not stop_event.is_set():
+            succeeded = False
+            try:
+                with scraper.metrics.timer("poll"):
+                    current_date = settings.current_date
+                    if polled_date != current_date:
+                        await fill_through_date_async(
+                            current_date, storage, scraper, seen_ids, prune=True
+                        )
+                        _, id_list = await storage.get_latest_date_with_dispatch_ids()
+                        high_water_mark = max(id_list, default=high_water_mark)
+                        polled_date = current_date
+                    else:
+                        entry_set = await poll_date(
+                            current_date,
+                            storage,
+                            scraper,
+                            HighWaterMark(high_water_mark, seen_ids),
+                            seen_ids
+                        )
+                        if entry_set.max_dispatch_number is not None:
+                            high_water_mark = max(high_water_mark, entry_set.max_dispatch_number)
+                succeeded = True
+            except Exception:
+                logger.exception("Caught error while polling")
+            if metrics is not None:
+                try:
+                    write_metrics(metrics, succeeded, scraper)
+                except Exception:
+                    logger.exception("Could not write metrics")
+            delay = settings.DAEMON_POLL_INTERVAL + random.uniform(
+                -settings.DAEMON_POLL_JITTER, settings.DAEMON_POLL_JITTER
+            )
+            try:
+                await asyncio.wait_for(stop_event.wait(), max(delay, 0))
+            except asyncio.TimeoutError:
+                pass
+
+
+def run_daemon(
+    storage: Union[BaseStorage, AsyncBaseStorage],
+    scraper: Scraper,
+    seen_ids: Optional[SeenDispatchIndex] = None,
+    metrics: Optional[Metrics] = None
+):
+    async def run():
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, stop_event.set)
+        async_storage = get_async_storage(storage)
+        try:
+            await run_daemon_async(async_storage, scraper, seen_ids, metrics, stop_event)
+        finally:
+            if async_storage is not storage:
+                await async_storage.close()
+
+    asyncio.run(run())
+
+
+def write_metrics(metrics: Metrics, succeeded: bool, scraper: Optional[Scraper] = None):
+    if scraper is not None:
+        for name, value in asdict(scraper.stats).items():
+            metrics.set_gauge(f"scraper_{name}", value)
+    metrics.set_gauge("last_run_success", int(succeeded))
+    metrics.set_gauge("last_run_timestamp_seconds", time.time())
+    metrics.write_to_data_dir()
 
 if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--noninteractive", action="store_true")
     parser.add_argument("--through", choices=["yesterday", "today"], default="yesterday")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running, polling today's activity log every DAEMON_POLL_INTERVAL seconds"
+    )
+    mode.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile the run's CPU time, memory and event loop, writing reports to DATA_DIR/profiles"
+    )
+    parser.add_argument(
+        "--slow-callback-duration",
+        type=float,
+        default=0.05,
+        help="With --profile, report callbacks that block the event loop for longer than this (seconds)"
+    )
     args = parser.parse_args()
     if args.noninteractive:
         settings.disable_logging_stream_handler()
+    metrics = Metrics.from_settings()
+    scraper = None
+    succeeded = False
     try:
         storage = settings.get_storage(not args.noninteractive)
         current_date = settings.current_date
         if args.through == "yesterday":
             current_date -= timedelta(days=1)
-        fill_through_date(current_date, storage)
-        storage.prune()
+        scraper = Scraper(
+            cache=ResponseCache.from_settings(),
+            fingerprints=PageFingerprints.from_settings(),
+            metrics=metrics
+        )
+        if args.daemon:
+            run_daemon(storage, scraper, SeenDispatchIndex.from_settings(), metrics)
+        else:
+            with metrics.timer("run") if metrics is not None else nullcontext():
+                if args.profile:
+                    profile_run(
+                        current_date,
+                        storage,
+                        scraper,
+                        SeenDispatchIndex.from_settings(),
+                        args.slow_callback_duration
+                    )
+                else:
+                    fill_through_date(
+                        current_date, storage, scraper, SeenDispatchIndex.from_settings(), prune=True
+                    )
+        succeeded = True
     except:
         logging.exception("Caught error during icbot run")
+    if metrics is not None:
+        try:
+            write_metrics(metrics, succeeded, scraper)
+        except:
+            logging.exception("Could not write metrics")
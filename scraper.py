@@ -1,28 +1,108 @@
-import asyncio, logging
-from contextlib import asynccontextmanager
+import asyncio, codecs, logging, random
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import aclosing, asynccontextmanager, nullcontext
 from dataclasses import dataclass
-from datetime import date, datetime, timedelta
-from typing import Any, Iterator, Optional, Union
+from datetime import date, datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from importlib import import_module
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Container,
+    Iterator,
+    Optional,
+    Protocol,
+    TypeVar,
+    Union
+)
+from urllib.parse import urlsplit
 
-from aiohttp import ClientSession
-from bs4 import BeautifulSoup
+from aiohttp import (
+    ClientConnectionError,
+    ClientPayloadError,
+    ClientResponse,
+    ClientSession,
+    ClientTimeout,
+    TCPConnector,
+    TraceConfig
+)
 
-from blotter import BlotterEntry
+from blotter import BlotterEntry, DetailsExtractor, parse_blotter_page, parse_details_page
 from icbot.config import settings
+from utils.http_cache import ResponseCache
+from utils.metrics import Metrics
+from utils.page_fingerprints import PageFingerprint, PageFingerprints
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+T_co = TypeVar("T_co", covariant=True)
+
+
+# Errors that may well not recur if the request is simply tried again
+TRANSIENT_ERRORS = (ClientConnectionError, ClientPayloadError, asyncio.TimeoutError)
+
 
 class BadResponse(RuntimeError):
-    def __init__(self, request_method: str, url: str, status: int):
+    def __init__(
+        self,
+        request_method: str,
+        url: str,
+        status: int,
+        retry_after: Optional[float] = None
+    ):
         self.request_method = request_method
         self.url = url
         self.status = status
+        # How many seconds the server asked us to wait before trying again, if
+        # it said
+        self.retry_after = retry_after
         super().__init__(
             f"{request_method.upper()} request to {url} failed with response {status}"
         )
 
 
+class RequestFailed(RuntimeError):
+    def __init__(self, request_method: str, url: str, error: Exception):
+        self.request_method = request_method
+        self.url = url
+        self.error = error
+        super().__init__(
+            f"{request_method.upper()} request to {url} failed: {error!r}"
+        )
+
+
+class CircuitOpenError(RuntimeError):
+    def __init__(self, request_method: str, url: str, retry_in: float):
+        self.request_method = request_method
+        self.url = url
+        self.retry_in = retry_in
+        super().__init__(
+            f"{request_method.upper()} request to {url} was not attempted as requests to "
+            f"{urlsplit(url).netloc} are suspended for another {retry_in:.0f}s after "
+            f"repeated failures"
+        )
+
+
+class DeadlineExceeded(RuntimeError):
+    def __init__(self, request_method: str, url: str, deadline: float):
+        self.request_method = request_method
+        self.url = url
+        self.deadline = deadline
+        super().__init__(
+            f"{request_method.upper()} request to {url} was abandoned when the "
+            f"{deadline}s deadline passed"
+        )
+
+
+# The errors a request may end in that concern only the requested page, rather
+# than the scrape as a whole
+REQUEST_ERRORS = (BadResponse, RequestFailed, CircuitOpenError, DeadlineExceeded)
+
+
 class BadResponses(RuntimeError):
     def __init__(self, errors: list[BadResponse]):
         self.errors = errors
@@ -33,27 +113,508 @@ class BadResponses(RuntimeError):
         )
 
 
+class IncrementalParser(Protocol[T_co]):
+    def feed(self, data: str) -> bool:
+        ...
+
+    def close(self) -> T_co:
+        ...
+
+
+@dataclass
+class FetchedPage:
+    status: int
+    body: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status == 304
+
+
 @dataclass
 class DispatchEntrySet:
     date: date
     entries: list[BlotterEntry]
+    # The fingerprint of the activity log page the entries came from, which
+    # should be recorded once they have been stored
+    fingerprint: Optional[PageFingerprint] = None
+    # Set if the activity log page hadn't changed since its fingerprint was
+    # last recorded, in which case there are no entries to store
+    unchanged: bool = False
+    # The highest dispatch number listed on the activity log page, including
+    # those of entries that were skipped or excluded
+    max_dispatch_number: Optional[int] = None
+
+
+@dataclass
+class ScraperStats:
+    requests: int = 0
+    queue_wait_total: float = 0.0
+    queue_wait_max: float = 0.0
+    # Requests re-attempted after a transient failure
+    retries: int = 0
+    # Requests that failed for good, whether or not they were retried
+    failures: int = 0
+    # Requests not attempted because of an open circuit breaker
+    short_circuits: int = 0
+    connections_created: int = 0
+    connections_reused: int = 0
+    # Requests duplicated for taking too long, and how many times the
+    # duplicate's response came back first
+    hedged_requests: int = 0
+    hedge_wins: int = 0
+
+    @property
+    def connection_reuse_rate(self) -> float:
+        connections = self.connections_created + self.connections_reused
+        return self.connections_reused / connections if connections else 0.0
+
+    @property
+    def queue_wait_mean(self) -> float:
+        return self.queue_wait_total / self.requests if self.requests else 0.0
+
+    def record_queue_wait(self, seconds: float):
+        self.requests += 1
+        self.queue_wait_total += seconds
+        self.queue_wait_max = max(self.queue_wait_max, seconds)
+
+
+class HostRateLimiter:
+    def __init__(self, requests_per_second: float):
+        self.interval = 1 / requests_per_second
+        self._next_slot = 0.0
+
+    async def wait(self):
+        # Slots are reserved before sleeping so that concurrent callers queue up
+        # behind one another rather than all waking at the same time.
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Returns the number of seconds a Retry-After header value asks to wait,
+    which may be given either as a number of seconds or as an HTTP date.
+    """
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(tz=timezone.utc)).total_seconds(), 0.0)
+
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = 4
+    backoff: float = 0.5
+    backoff_max: float = 30.0
+    retry_statuses: frozenset[int] = frozenset({429, 500, 502, 503, 504})
+    # Only requests that can safely be repeated are retried
+    retry_methods: frozenset[str] = frozenset({"get", "head", "options"})
+
+    @classmethod
+    def from_settings(cls) -> "RetryPolicy":
+        return cls(
+            max_attempts=settings.REQUEST_MAX_ATTEMPTS,
+            backoff=settings.REQUEST_RETRY_BACKOFF,
+            backoff_max=settings.REQUEST_RETRY_BACKOFF_MAX,
+            retry_statuses=settings.REQUEST_RETRY_STATUSES
+        )
+
+    def is_retryable(self, method: str, error: Exception) -> bool:
+        if method not in self.retry_methods:
+            return False
+        if isinstance(error, BadResponse):
+            return error.status in self.retry_statuses
+        return isinstance(error, RequestFailed)
+
+    def get_delay(self, attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """
+        Returns how long to wait before retrying a request that has failed
+        ``attempt`` times, or None if it shouldn't be retried.
+        """
+        if attempt >= self.max_attempts:
+            return None
+        if retry_after is not None:
+            return retry_after if retry_after <= self.backoff_max else None
+        # "Full jitter" keeps concurrent retries from arriving in lockstep
+        return random.uniform(0, min(self.backoff * 2 ** (attempt - 1), self.backoff_max))
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    def get_retry_in(self) -> float:
+        """
+        Returns 0 if a request may be attempted now, and otherwise how many
+        seconds remain until one may be. Once the circuit has been open for
+        ``reset_timeout`` seconds, a single trial request is let through; the
+        circuit closes again if it succeeds.
+        """
+        if self._opened_at is None:
+            return 0.0
+        retry_in = self._opened_at + self.reset_timeout - asyncio.get_running_loop().time()
+        if retry_in > 0:
+            return retry_in
+        if self._probing:
+            return self.reset_timeout
+        self._probing = True
+        return 0.0
+
+    @property
+    def probing(self) -> bool:
+        return self._probing
+
+    def abandon_trial(self):
+        """
+        Lets another trial request through in place of one that ended without
+        an outcome (e.g., because it was cancelled).
+        """
+        self._probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.failures >= self.failure_threshold:
+            if self._opened_at is None:
+                logger.warning(
+                    "Suspending requests for %ss after %s consecutive failures",
+                    self.reset_timeout,
+                    self.failures
+                )
+            self._opened_at = asyncio.get_running_loop().time()
+
+
+def get_accept_encoding(encodings: list[str]) -> str:
+    """
+    Returns an Accept-Encoding header value for those of ``encodings`` that
+    aiohttp is able to decode here.
+    """
+    def can_decode(encoding: str) -> bool:
+        if encoding != "br":
+            return True
+        for module_name in ("brotli", "brotlicffi"):
+            try:
+                import_module(module_name)
+            except ImportError:
+                continue
+            return True
+        return False
+
+    return ", ".join(filter(can_decode, encodings))
+
+
+def get_parser_executor(kind: Optional[str], max_workers: Optional[int] = None) -> Optional[Executor]:
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers)
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers, thread_name_prefix="icbot-parser")
+    return None
+
+
+def check_status(method: str, url: str, response: ClientResponse):
+    if response.status >= 400:
+        raise BadResponse(
+            method,
+            url,
+            response.status,
+            retry_after=parse_retry_after(response.headers.get("Retry-After"))
+        )
 
 
 class Scraper:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        max_concurrent_requests: Optional[int] = None,
+        requests_per_second_per_host: Optional[float] = None,
+        parser_executor: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        fingerprints: Optional[PageFingerprints] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        circuit_breaker_threshold: Optional[int] = None,
+        circuit_breaker_reset_timeout: Optional[float] = None,
+        day_deadline: Optional[float] = None,
+        hedge_percentile: Optional[float] = None,
+        metrics: Optional[Metrics] = None
+    ) -> None:
         self._session = None
+        self.metrics = metrics or Metrics()
+        self.cache = cache
+        self.fingerprints = fingerprints
+        self._parser_executor = None
+        self.parser_executor_kind = parser_executor or settings.PARSER_EXECUTOR
+        if max_concurrent_requests is None:
+            max_concurrent_requests = settings.MAX_CONCURRENT_REQUESTS
+        if requests_per_second_per_host is None:
+            requests_per_second_per_host = settings.MAX_REQUESTS_PER_SECOND_PER_HOST
+        self._request_semaphore = (
+            asyncio.Semaphore(max_concurrent_requests) if max_concurrent_requests else None
+        )
+        self.requests_per_second_per_host = requests_per_second_per_host
+        self._rate_limiters: dict[str, HostRateLimiter] = {}
+        self.retry_policy = retry_policy or RetryPolicy.from_settings()
+        if circuit_breaker_threshold is None:
+            circuit_breaker_threshold = settings.CIRCUIT_BREAKER_THRESHOLD
+        if circuit_breaker_reset_timeout is None:
+            circuit_breaker_reset_timeout = settings.CIRCUIT_BREAKER_RESET_TIMEOUT
+        self.circuit_breaker_threshold = circuit_breaker_threshold
+        self.circuit_breaker_reset_timeout = circuit_breaker_reset_timeout
+        self._circuit_breakers: dict[str, CircuitBreaker] = {}
+        if day_deadline is None:
+            day_deadline = settings.DAY_DEADLINE
+        self.day_deadline = day_deadline
+        if hedge_percentile is None:
+            hedge_percentile = settings.HEDGE_PERCENTILE
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = settings.HEDGE_MIN_SAMPLES
+        self._latencies: deque[float] = deque(maxlen=1000)
+        self.stats = ScraperStats()
+
+    def get_trace_config(self) -> TraceConfig:
+        trace_config = TraceConfig()
+
+        async def on_connection_create_end(*args: Any):
+            self.stats.connections_created += 1
+
+        async def on_connection_reuseconn(*args: Any):
+            self.stats.connections_reused += 1
+
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
 
     @asynccontextmanager
     async def session(self):
         prev = self._session
+        connector = None
         try:
             if prev is None:
-                self._session = ClientSession()
+                connector = TCPConnector(**settings.HTTP_CONNECTOR)
+                headers = {}
+                accept_encoding = get_accept_encoding(settings.HTTP_ACCEPT_ENCODINGS)
+                if accept_encoding:
+                    headers["Accept-Encoding"] = accept_encoding
+                self._session = ClientSession(
+                    connector=connector,
+                    timeout=ClientTimeout(**settings.HTTP_TIMEOUT),
+                    headers=headers,
+                    trace_configs=[self.get_trace_config()]
+                )
+                self._parser_executor = get_parser_executor(
+                    self.parser_executor_kind, settings.PARSER_EXECUTOR_MAX_WORKERS
+                )
             yield self._session
         finally:
             if prev is None:
-                await self._session.close()
-                self._session = None
+                if self._session is not None:
+                    await self._session.close()
+                    self._session = None
+                if connector is not None:
+                    # The session closes its connector too, but not if it
+                    # failed to be created
+                    await connector.close()
+                if self._parser_executor is not None:
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self._parser_executor.shutdown
+                    )
+                    self._parser_executor = None
+
+    async def parse(self, func: Callable[..., T], *args: Any) -> T:
+        if self._parser_executor is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._parser_executor, func, *args
+        )
+
+    def get_rate_limiter(self, url: str) -> Optional[HostRateLimiter]:
+        if not self.requests_per_second_per_host:
+            return None
+        host = urlsplit(url).netloc
+        if host not in self._rate_limiters:
+            self._rate_limiters[host] = HostRateLimiter(self.requests_per_second_per_host)
+        return self._rate_limiters[host]
+
+    def get_circuit_breaker(self, url: str) -> Optional[CircuitBreaker]:
+        if not self.circuit_breaker_threshold:
+            return None
+        host = urlsplit(url).netloc
+        if host not in self._circuit_breakers:
+            self._circuit_breakers[host] = CircuitBreaker(
+                self.circuit_breaker_threshold, self.circuit_breaker_reset_timeout
+            )
+        return self._circuit_breakers[host]
+
+    async def with_retries(self, method: str, url: str, attempt: Callable[[], Awaitable[T]]) -> T:
+        """
+        Awaits ``attempt()`` (which should issue the request) until it
+        succeeds, fails in a way that isn't worth retrying, or runs out of
+        attempts under the retry policy, and keeps the host's circuit breaker
+        informed of the outcomes. Transient errors that end up being raised are
+        wrapped in ``RequestFailed``.
+        """
+        circuit_breaker = self.get_circuit_breaker(url)
+        attempt_count = 0
+        while True:
+            if circuit_breaker is not None:
+                retry_in = circuit_breaker.get_retry_in()
+                if retry_in:
+                    self.stats.short_circuits += 1
+                    raise CircuitOpenError(method, url, retry_in)
+            is_trial = circuit_breaker is not None and circuit_breaker.probing
+            attempt_count += 1
+            try:
+                result = await attempt()
+            except BadResponse as e:
+                error = e
+            except TRANSIENT_ERRORS as e:
+                error = RequestFailed(method, url, e)
+            except BaseException:
+                # Otherwise the circuit would stay open for good
+                if is_trial:
+                    circuit_breaker.abandon_trial()
+                raise
+            else:
+                if circuit_breaker is not None:
+                    circuit_breaker.record_success()
+                return result
+            retryable = self.retry_policy.is_retryable(method, error)
+            if circuit_breaker is not None:
+                if isinstance(error, RequestFailed) or error.status in self.retry_policy.retry_statuses:
+                    circuit_breaker.record_failure()
+                else:
+                    # The host is up, even if it can't help with this URL
+                    circuit_breaker.record_success()
+            delay = None
+            if retryable:
+                delay = self.retry_policy.get_delay(
+                    attempt_count, getattr(error, "retry_after", None)
+                )
+            if delay is None:
+                self.stats.failures += 1
+                raise error
+            self.stats.retries += 1
+            logger.info(
+                "%s; retrying in %.2fs (attempt %s of %s)",
+                error,
+                delay,
+                attempt_count + 1,
+                self.retry_policy.max_attempts
+            )
+            await asyncio.sleep(delay)
+
+    def get_hedge_delay(self) -> Optional[float]:
+        """
+        Returns how long a request may be in flight before it is hedged, or
+        None if requests aren't to be hedged (yet).
+        """
+        if not self.hedge_percentile or len(self._latencies) < max(self.hedge_min_samples, 1):
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[round(self.hedge_percentile / 100 * (len(latencies) - 1))]
+
+    async def hedged(self, attempt: Callable[[], Awaitable[T]]) -> T:
+        """
+        Awaits ``attempt()``, calling it a second time if the first call hasn't
+        finished by the time given by ``get_hedge_delay()``, and returns the
+        result of whichever call succeeds first. The error from the first call
+        is raised if both fail.
+        """
+        hedge_delay = self.get_hedge_delay()
+        if hedge_delay is None:
+            return await attempt()
+        first = asyncio.ensure_future(attempt())
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedge_delay)
+            if done:
+                return first.result()
+            self.stats.hedged_requests += 1
+            second = asyncio.ensure_future(attempt())
+            pending.add(second)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.stats.hedge_wins += 1
+                        return task.result()
+            return first.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @asynccontextmanager
+    async def request_slot(self, url: str):
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        if self._request_semaphore is not None:
+            await self._request_semaphore.acquire()
+        try:
+            rate_limiter = self.get_rate_limiter(url)
+            if rate_limiter is not None:
+                await rate_limiter.wait()
+            started_at = loop.time()
+            self.stats.record_queue_wait(started_at - queued_at)
+            yield
+            # Only successful requests inform the hedging threshold
+            self._latencies.append(loop.time() - started_at)
+        finally:
+            if self._request_semaphore is not None:
+                self._request_semaphore.release()
+
+    async def request(
+        self,
+        session: ClientSession,
+        url: str,
+        method: str = "get",
+        headers: Optional[dict[str, str]] = None,
+        **data: Any
+    ) -> FetchedPage:
+        request_kwargs: dict[str, Any] = {"data": data}
+        if headers:
+            request_kwargs["headers"] = headers
+
+        async def attempt() -> FetchedPage:
+            async with self.request_slot(url):
+                logger.debug("Issuing %s request to %s...", method.upper(), url)
+                async with getattr(session, method)(url, **request_kwargs) as response:
+                    logger.debug("Got %s status from %s", response.status, url)
+                    check_status(method, url, response)
+                    if response.status == 304:
+                        return FetchedPage(response.status)
+                    return FetchedPage(
+                        response.status,
+                        await response.text(),
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified")
+                    )
+
+        if method == "get":
+            return await self.with_retries(method, url, lambda: self.hedged(attempt))
+        return await self.with_retries(method, url, attempt)
 
     async def fetch_one(
         self,
@@ -62,12 +623,66 @@ class Scraper:
         method: str = "get",
         **data: Any
     ) -> str:
-        logger.debug("Issuing %s request to %s...", method.upper(), url)
-        async with getattr(session, method)(url, data=data) as response:
-            logger.debug("Got %s status from %s", response.status, url)
-            if response.status >= 400:
-                raise BadResponse(method, url, response.status)
-            return await response.text()
+        cached_response = None
+        headers = None
+        # Only plain GETs are cacheable
+        use_cache = self.cache is not None and method == "get" and not data
+        if use_cache:
+            cached_response = self.cache.get(url)
+            if cached_response is not None:
+                if self.cache.is_fresh(cached_response):
+                    logger.debug("Using cached response for %s", url)
+                    return cached_response.body
+                headers = cached_response.get_validator_headers()
+        page = await self.request(session, url, method, headers, **data)
+        if page.not_modified and cached_response is not None:
+            self.cache.revalidate(url)
+            return cached_response.body
+        if use_cache:
+            self.cache.put(url, page.body, etag=page.etag, last_modified=page.last_modified)
+        return page.body
+
+    async def fetch_streamed(
+        self,
+        session: ClientSession,
+        url: str,
+        parser_factory: Callable[[], IncrementalParser[T]],
+        chunk_size: int = 8192
+    ) -> T:
+        """
+        Streams the body of the page at ``url`` into a parser created by
+        calling ``parser_factory`` (once per attempt, should the request need
+        retrying) and returns the parser's result.
+        """
+        if self.cache is not None:
+            # Caching needs the whole body anyway
+            parser = parser_factory()
+            parser.feed(await self.fetch_one(session, url))
+            try:
+                return parser.close()
+            except Exception:
+                # Rather than serve the same unparseable page until it goes stale
+                self.cache.delete(url)
+                raise
+
+        async def attempt() -> T:
+            parser = parser_factory()
+            async with self.request_slot(url):
+                logger.debug("Issuing streamed GET request to %s...", url)
+                async with session.get(url, data={}) as response:
+                    logger.debug("Got %s status from %s", response.status, url)
+                    check_status("get", url, response)
+                    decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        # Once the parser has what it needs, the rest of the body
+                        # is never read
+                        if parser.feed(decoder.decode(chunk)):
+                            break
+                    else:
+                        parser.feed(decoder.decode(b"", final=True))
+            return parser.close()
+
+        return await self.with_retries("get", url, lambda: self.hedged(attempt))
 
     async def fetch_many(self, session: ClientSession, *urls: str) -> list[Union[str, Exception]]:
         return await asyncio.gather(
@@ -75,71 +690,259 @@ class Scraper:
             return_exceptions=True
         )
 
+    async def fetch_as_completed(
+        self,
+        session: ClientSession,
+        *urls: str,
+        parser_factory: Optional[Callable[[], IncrementalParser[Any]]] = None,
+        timeout: Optional[float] = None,
+        timer_name: Optional[str] = None
+    ) -> AsyncIterator[tuple[int, Union[Any, Exception]]]:
+        """
+        Yields the response to each URL (along with the URL's index) in the
+        order the responses arrive. If ``parser_factory`` is given, response
+        bodies are streamed into a parser created by calling it and the
+        parser's result is yielded instead of the body. If ``timeout`` is
+        given, iteration stops once that many seconds have passed, and any
+        requests still outstanding are abandoned. If ``timer_name`` is given,
+        the time taken to fetch each URL is recorded under it in ``metrics``.
+        """
+        async def fetch(i: int, url: str) -> tuple[int, Union[Any, Exception]]:
+            try:
+                with self.metrics.timer(timer_name) if timer_name else nullcontext():
+                    if parser_factory is None:
+                        return i, await self.fetch_one(session, url)
+                    return i, await self.fetch_streamed(session, url, parser_factory)
+            except Exception as e:
+                return i, e
+
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        pending = {asyncio.ensure_future(fetch(i, url)) for i, url in enumerate(urls)}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=None if deadline is None else max(deadline - loop.time(), 0),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    logger.debug("Abandoning %s outstanding request(s)", len(pending))
+                    return
+                while done:
+                    yield done.pop().result()
+        finally:
+            for task in pending:
+                task.cancel()
+
 
 async def fetch_dispatch_entries(
     for_date: date,
-    skip_ids: Optional[list[int]] = None,
+    skip_ids: Optional[Container[int]] = None,
     scraper: Optional[Scraper] = None
 ) -> DispatchEntrySet:
     if scraper is None:
         scraper = Scraper()
+    if isinstance(skip_ids, list):
+        skip_ids = set(skip_ids)
+    started_at = asyncio.get_running_loop().time()
     async with scraper.session() as session:
-        blotter_page = BeautifulSoup(await scraper.fetch_one(
-            session,
-            settings.POLICE_LOG_URL,
-            activityDate=for_date.strftime(settings.POLICE_LOG_DATETIME_FORMAT)
-        ), "html.parser")
-        entries = BlotterEntry.from_page(blotter_page)
-        filtered_entries = list(filter(
-            lambda entry: not entry.exclude and not (skip_ids and entry.dispatch_number in skip_ids),
-            entries
-        ))
+        previous_fingerprint = None
+        if scraper.fingerprints is not None:
+            previous_fingerprint = scraper.fingerprints.get(for_date)
+        metrics = scraper.metrics
+        with metrics.timer("blotter_fetch"):
+            blotter_response = await scraper.request(
+                session,
+                settings.POLICE_LOG_URL,
+                headers=previous_fingerprint.get_validator_headers() if previous_fingerprint else None,
+                activityDate=for_date.strftime(settings.POLICE_LOG_DATETIME_FORMAT)
+            )
+        fingerprint = None
+        if scraper.fingerprints is not None and not blotter_response.not_modified:
+            fingerprint = PageFingerprint.from_content(
+                blotter_response.body,
+                repr(settings.BLOCKING_FILTERS),
+                etag=blotter_response.etag,
+                last_modified=blotter_response.last_modified
+            )
+        if previous_fingerprint is not None and (
+            blotter_response.not_modified or fingerprint.digest == previous_fingerprint.digest
+        ):
+            logger.info("Activity log for %s is unchanged since the last run; nothing to do", for_date)
+            metrics.increment("days_unchanged")
+            return DispatchEntrySet(
+                date=for_date, entries=[], fingerprint=previous_fingerprint, unchanged=True
+            )
+        with metrics.timer("blotter_parse"):
+            entries = [
+                BlotterEntry(**fields)
+                for fields in await scraper.parse(
+                    parse_blotter_page, blotter_response.body, settings.POLICE_LOG_URL
+                )
+            ]
+        del blotter_response
+        with metrics.timer("first_filter"):
+            filtered_entries = list(filter(
+                lambda entry: not entry.exclude and not (skip_ids is not None and entry.dispatch_number in skip_ids),
+                entries
+            ))
         entry_count = len(entries)
         filtered_entry_count = len(filtered_entries)
+        metrics.increment("days_scraped")
+        metrics.increment("entries_listed", entry_count)
+        metrics.increment("entries_excluded_first_pass", entry_count - filtered_entry_count)
         logger.debug(
             "Excluded %s entries out of %s from initial set",
             entry_count - filtered_entry_count,
             entry_count
         )
-        detail_responses = await scraper.fetch_many(
-            session, *(entry.url for entry in filtered_entries)
-        )
+        stream_detail_pages = settings.STREAM_DETAIL_PAGES
+
+        async def parse_details(entry: BlotterEntry, detail_page: str):
+            with metrics.timer("detail_parse"):
+                try:
+                    entry.details = await scraper.parse(parse_details_page, detail_page)
+                except Exception:
+                    # Rather than serve the same unparseable page until it
+                    # goes stale
+                    if scraper.cache is not None:
+                        scraper.cache.delete(entry.url)
+                    raise
+
         failure_count = 0
-        for i, response in enumerate(detail_responses):
-            if isinstance(response, BadResponse):
-                filtered_entries[i].error = response
-                failure_count += 1
-            elif isinstance(response, Exception):
-                raise response
-            else:
-                logger.debug("Parsing details from response #%s...", i + 1)
-                detail_page = BeautifulSoup(response, "html.parser")
-                filtered_entries[i].set_details_from_page(detail_page)
+        parse_tasks = []
+        outstanding = set(range(len(filtered_entries)))
+        try:
+            async with aclosing(scraper.fetch_as_completed(
+                session,
+                *(entry.url for entry in filtered_entries),
+                parser_factory=DetailsExtractor if stream_detail_pages else None,
+                timeout=(
+                    scraper.day_deadline - (asyncio.get_running_loop().time() - started_at)
+                    if scraper.day_deadline else None
+                ),
+                timer_name="detail_fetch"
+            )) as detail_responses:
+                async for i, response in detail_responses:
+                    outstanding.discard(i)
+                    if isinstance(response, REQUEST_ERRORS):
+                        filtered_entries[i].error = response
+                        failure_count += 1
+                    elif isinstance(response, Exception):
+                        raise response
+                    elif stream_detail_pages:
+                        filtered_entries[i].details = response
+                    else:
+                        logger.debug("Parsing details from response #%s...", i + 1)
+                        parse_tasks.append(asyncio.ensure_future(
+                            parse_details(filtered_entries[i], response)
+                        ))
+                        # Don't hang on to the page while waiting on the rest
+                        del response
+            await asyncio.gather(*parse_tasks)
+        finally:
+            for task in parse_tasks:
+                task.cancel()
+        for i in outstanding:
+            filtered_entries[i].error = DeadlineExceeded(
+                "get", filtered_entries[i].url, scraper.day_deadline
+            )
+        failure_count += len(outstanding)
         if failure_count:
             logger.debug("Encountered %s failure(s)", failure_count)
-        filtered_entries = list(filter(
-            lambda entry: isinstance(entry, BlotterEntry) and not entry.exclude,
-            filtered_entries
-        ))
+            metrics.increment("detail_fetch_failures", failure_count)
+        with metrics.timer("second_filter"):
+            filtered_entries = list(filter(
+                lambda entry: isinstance(entry, BlotterEntry) and not entry.exclude,
+                filtered_entries
+            ))
+        metrics.increment(
+            "entries_excluded_second_pass", filtered_entry_count - len(filtered_entries)
+        )
         logger.debug(
             "Excluded %s entries out of %s from initial filtered set",
             filtered_entry_count - len(filtered_entries),
             filtered_entry_count
         )
-        return DispatchEntrySet(date=for_date, entries=filtered_entries)
+        return DispatchEntrySet(
+            date=for_date,
+            entries=filtered_entries,
+            fingerprint=fingerprint,
+            max_dispatch_number=max((entry.dispatch_number for entry in entries), default=None)
+        )
 
 
-async def fetch_dispatch_entries_for_date_range(
+async def iter_dispatch_entries_for_date_range(
     from_date: date,
     through_date: Optional[date] = None,
-    skip_ids: Optional[list[int]] = None
-) -> list[DispatchEntrySet]:
+    skip_ids: Optional[Container[int]] = None,
+    max_concurrent_days: Optional[int] = None,
+    scraper: Optional[Scraper] = None
+) -> AsyncIterator[DispatchEntrySet]:
+    """
+    Yields the entries for each day in the range, in date order, as soon as
+    they (and those of every day before) are ready. Days are scraped
+    concurrently, but a new day is only started once an earlier one has been
+    consumed, so no more than ``max_concurrent_days`` days are ever in flight
+    or waiting to be consumed.
+    """
     if through_date is None:
         through_date = datetime.now(tz=settings.timezone).date()
-    scraper = Scraper()
-    entry_sets: list[DispatchEntrySet] = []
-    async with scraper.session() as session:
-        while from_date <= through_date:
-            entry_sets.append(await fetch_dispatch_entries(from_date, skip_ids, scraper))
-            from_date += timedelta(days=1)
-    return entry_sets
+    if max_concurrent_days is None:
+        max_concurrent_days = settings.MAX_CONCURRENT_DAYS
+    max_concurrent_days = max(max_concurrent_days, 1)
+    if scraper is None:
+        scraper = Scraper()
+    window: deque[asyncio.Future] = deque()
+    async with scraper.session():
+        try:
+            for i in range((through_date - from_date).days + 1):
+                window.append(asyncio.ensure_future(fetch_dispatch_entries(
+                    from_date + timedelta(days=i), skip_ids, scraper
+                )))
+                if len(window) >= max_concurrent_days:
+                    yield await window.popleft()
+            while window:
+                yield await window.popleft()
+        finally:
+            for task in window:
+                task.cancel()
+            await asyncio.gather(*window, return_exceptions=True)
+    logger.debug(
+        "Issued %s request(s) with a mean queue wait of %.3fs (max %.3fs); "
+        "%s retried, %s failed, %s short-circuited, %s hedged (%s by a faster duplicate); "
+        "%s connection(s) opened, %s reused",
+        scraper.stats.requests,
+        scraper.stats.queue_wait_mean,
+        scraper.stats.queue_wait_max,
+        scraper.stats.retries,
+        scraper.stats.failures,
+        scraper.stats.short_circuits,
+        scraper.stats.hedged_requests,
+        scraper.stats.hedge_wins,
+        scraper.stats.connections_created,
+        scraper.stats.connections_reused
+    )
+    if scraper.cache is not None:
+        logger.debug(
+            "Response cache: %s hit(s), %s miss(es), %s revalidation(s), %s eviction(s)",
+            scraper.cache.hits,
+            scraper.cache.misses,
+            scraper.cache.revalidations,
+            scraper.cache.evictions
+        )
+
+
+async def fetch_dispatch_entries_for_date_range(
+    from_date: date,
+    through_date: Optional[date] = None,
+    skip_ids: Optional[Container[int]] = None,
+    max_concurrent_days: Optional[int] = None,
+    scraper: Optional[Scraper] = None
+) -> list[DispatchEntrySet]:
+    return [
+        entry_set async for entry_set in iter_dispatch_entries_for_date_range(
+            from_date, through_date, skip_ids, max_concurrent_days, scraper
+        )
+    ]
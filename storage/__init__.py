@@ -1 +1,16 @@
+from importlib import import_module
 
+# Backends are imported on first access (e.g. by a STORAGE setting such as
+# "storage.SQLiteStorage") since they import modules that import this package
+BACKENDS = {
+    "GoogleSheetsStorage": ".google_sheets",
+    "SQLiteStorage": ".sqlite"
+}
+
+
+def __getattr__(name: str):
+    try:
+        module_path = BACKENDS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(module_path, __name__), name)
@@ -1,16 +1,34 @@
+import asyncio
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
+from functools import partial
 from importlib import import_module
-from typing import Optional, TYPE_CHECKING
+from typing import Any, Callable, Iterable, Optional, TYPE_CHECKING, Union
 
 if TYPE_CHECKING:
     from scraper import DispatchEntrySet
 
 
 class BaseStorage(ABC):
+    # If True, callers storing a range of days should store several with each
+    # store_entry_sets() call rather than each as soon as it's ready, e.g.,
+    # because each call uses up some of a limited API quota. A batch is stored
+    # before the get_write_size() of its days would exceed maximum_write_size
+    batch_writes = False
+    maximum_write_size: Optional[int] = None
+
     def __init__(self):
         self.interactive = None
 
+    def get_write_size(self, entry_set: "DispatchEntrySet") -> int:
+        """
+        Returns the approximate size of storing the day's entries, in the
+        units of ``maximum_write_size``. This is called from the event loop's
+        thread, so it mustn't touch anything the storage's own calls change.
+        """
+        return 0
+
     @abstractmethod
     def get_latest_date_with_dispatch_ids(self) -> tuple[Optional[date], list[int]]:
         ...
@@ -19,10 +37,95 @@ class BaseStorage(ABC):
     def store_entries(self, entry_set: "DispatchEntrySet"):
         ...
 
+    def store_entry_sets(self, entry_sets: Iterable["DispatchEntrySet"], prune: bool = False):
+        """
+        Stores several days' entries at once, optionally pruning afterwards.
+        Backends that can write more efficiently in bulk should override this.
+        """
+        for entry_set in entry_sets:
+            self.store_entries(entry_set)
+        if prune:
+            self.prune()
+
     def prune(self):
         pass
 
 
+class AsyncBaseStorage(ABC):
+    """
+    The asynchronous counterpart of ``BaseStorage``, for use by callers that
+    want storage calls to overlap with other work on the event loop.
+    """
+    # As for BaseStorage
+    batch_writes = False
+    maximum_write_size: Optional[int] = None
+
+    def get_write_size(self, entry_set: "DispatchEntrySet") -> int:
+        return 0
+
+    @abstractmethod
+    async def get_latest_date_with_dispatch_ids(self) -> tuple[Optional[date], list[int]]:
+        ...
+
+    @abstractmethod
+    async def store_entries(self, entry_set: "DispatchEntrySet"):
+        ...
+
+    async def store_entry_sets(self, entry_sets: Iterable["DispatchEntrySet"], prune: bool = False):
+        for entry_set in entry_sets:
+            await self.store_entries(entry_set)
+        if prune:
+            await self.prune()
+
+    async def prune(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class ThreadedStorage(AsyncBaseStorage):
+    """
+    Adapts a synchronous ``BaseStorage`` by running its calls on a worker
+    thread. There is only the one thread, so calls are made one at a time and
+    in order, as the wrapped storage expects.
+    """
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+        self.batch_writes = storage.batch_writes
+        self.maximum_write_size = storage.maximum_write_size
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="icbot-storage")
+
+    async def _call(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, partial(func, *args, **kwargs)
+        )
+
+    def get_write_size(self, entry_set: "DispatchEntrySet") -> int:
+        return self.storage.get_write_size(entry_set)
+
+    async def get_latest_date_with_dispatch_ids(self) -> tuple[Optional[date], list[int]]:
+        return await self._call(self.storage.get_latest_date_with_dispatch_ids)
+
+    async def store_entries(self, entry_set: "DispatchEntrySet"):
+        await self._call(self.storage.store_entries, entry_set)
+
+    async def store_entry_sets(self, entry_sets: Iterable["DispatchEntrySet"], prune: bool = False):
+        await self._call(self.storage.store_entry_sets, list(entry_sets), prune=prune)
+
+    async def prune(self):
+        await self._call(self.storage.prune)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+
+
+def get_async_storage(storage: Union[BaseStorage, AsyncBaseStorage]) -> AsyncBaseStorage:
+    if isinstance(storage, AsyncBaseStorage):
+        return storage
+    return ThreadedStorage(storage)
+
+
 def get_concrete_storage(interactive, class_path, **init_kwargs) -> BaseStorage:
     module_path, _, class_name = class_path.rpartition(".")
     storage = getattr(import_module(module_path), class_name)(**init_kwargs)
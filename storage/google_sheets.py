@@ -1,13 +1,14 @@
-import logging
+import json, logging, random, time
 from datetime import date, datetime
 from functools import cached_property
-from typing import Any, Optional
+from typing import Any, Container, Iterable, Iterator, Optional
 
 from google.auth.exceptions import RefreshError
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 
 from icbot.config import settings
 from scraper import DispatchEntrySet
@@ -35,6 +36,8 @@ class RemoteServerFlow(Flow):
 
 
 class GoogleSheetsStorage(BaseStorage):
+    # Every batchUpdate call counts against the per-minute write quota
+    batch_writes = True
     DATE_FORMAT = "%Y-%m-%d"
     HEADERS = [
         "Dispatch ID",
@@ -50,12 +53,26 @@ class GoogleSheetsStorage(BaseStorage):
         spreadsheet_id: str,
         client_secrets_file: str,
         scopes: Optional[list[str]] = None,
-        maximum_sheet_count: int = 20
+        maximum_sheet_count: int = 20,
+        maximum_request_size: int = 2 * 1024 * 1024,
+        num_retries: int = 5,
+        service: Any = None
     ):
         self.spreadsheet_id = spreadsheet_id
         self.client_secrets_file = client_secrets_file
         self.scopes = scopes or ["https://www.googleapis.com/auth/drive.file"]
         self.maximum_sheet_count = maximum_sheet_count
+        # The approximate maximum size (in bytes of JSON) of a single
+        # batchUpdate call's body
+        self.maximum_request_size = maximum_request_size
+        # How many times API calls failing with a rate limit (429) error are
+        # retried, with exponential backoff (reads are also retried on server
+        # errors, which a batch update may have been applied in spite of)
+        self.num_retries = num_retries
+        # An API service object may be given in place of the one built from
+        # the credentials, e.g., to talk to a stand-in for the API
+        if service is not None:
+            self.service = service
 
     @classmethod
     def get_date_from_sheet_data(cls, sheet_data: dict[str, Any], default: Any = None) -> Any:
@@ -104,29 +121,49 @@ class GoogleSheetsStorage(BaseStorage):
                 f.write(creds.to_json())
         return build("sheets", "v4", credentials=creds)
 
-    @cached_property
-    def sorted_sheets(self) -> list[dict[str, Any]]:
-        book_data = self.service.spreadsheets().get(spreadsheetId=self.spreadsheet_id).execute()
+    def fetch_sheets(self) -> list[dict[str, Any]]:
+        book_data = self.service.spreadsheets().get(
+            spreadsheetId=self.spreadsheet_id, fields="sheets.properties"
+        ).execute(num_retries=self.num_retries)
+        return book_data["sheets"]
+
+    @classmethod
+    def sort_sheets(cls, sheets: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
         return sorted(
-            book_data["sheets"],
-            key=lambda sheet_data: GoogleSheetsStorage.get_date_from_sheet_data(sheet_data, default=date(1900, 1, 1))
+            sheets,
+            key=lambda sheet_data: cls.get_date_from_sheet_data(sheet_data, default=date(1900, 1, 1))
         )
 
+    @cached_property
+    def sheets(self) -> dict[int, dict[str, Any]]:
+        """
+        The spreadsheet's sheets by ID (which, for the sheets this class adds,
+        is the sheet's date as YYYYMMDD). This is fetched once and then kept
+        up to date from the replies to our own batch updates.
+        """
+        return {sheet_data["properties"]["sheetId"]: sheet_data for sheet_data in self.fetch_sheets()}
+
+    @property
+    def sorted_sheets(self) -> list[dict[str, Any]]:
+        return self.sort_sheets(self.sheets.values())
+
     def get_latest_date_with_dispatch_ids(self) -> tuple[Optional[date], list[int]]:
         sheets = self.sorted_sheets
         sheet_date = self.get_date_from_sheet_data(sheets[-1])
         sheet_properties = sheets[-1]["properties"]
         dispatch_ids = []
         if sheet_date:
+            # Only the ID column is needed
             sheet_contents = self.service.spreadsheets().values().get(
-                spreadsheetId=self.spreadsheet_id, range=sheet_properties["title"]
-            ).execute()
-            if sheet_contents["values"][0][0] != "Dispatch ID":
+                spreadsheetId=self.spreadsheet_id,
+                range="'{}'!A:A".format(sheet_properties["title"].replace("'", "''"))
+            ).execute(num_retries=self.num_retries)
+            if sheet_contents.get("values", [[None]])[0][0] != "Dispatch ID":
                 raise UnexpectedContentsError(
                     f"Did not find expected contents in top left cell of sheet {sheet_properties['title']}"
                 )
             for i, row in enumerate(sheet_contents["values"][1:]):
-                if not row[0]:
+                if not row or not row[0]:
                     break
                 try:
                     dispatch_ids.append(int(row[0]))
@@ -136,11 +173,15 @@ class GoogleSheetsStorage(BaseStorage):
                     )
         return sheet_date, dispatch_ids
 
-    def store_entries(self, entry_set: DispatchEntrySet):
+    def get_store_requests(
+        self,
+        entry_set: DispatchEntrySet,
+        existing_sheet_ids: Container[int]
+    ) -> list[dict[str, Any]]:
         sheet_id = int(entry_set.date.strftime("%Y%m%d"))
         requests = []
         rows = []
-        if sheet_id not in set(data["properties"]["sheetId"] for data in self.sorted_sheets):
+        if sheet_id not in existing_sheet_ids:
             requests.append({
                 "addSheet": {
                     "properties": {
@@ -165,23 +206,85 @@ class GoogleSheetsStorage(BaseStorage):
                 "fields": "userEnteredValue"
             }
         })
-        self.service.spreadsheets().batchUpdate(
-            spreadsheetId=self.spreadsheet_id,
-            body={"requests": requests}
-        ).execute()
+        return requests
 
-    def prune(self):
-        sheets = self.sorted_sheets
+    def get_write_size(self, entry_set: DispatchEntrySet) -> int:
+        # As if the day's sheet had to be added, which only reads entry_set
+        return sum(len(json.dumps(request)) for request in self.get_store_requests(entry_set, ()))
+
+    @property
+    def maximum_write_size(self) -> int:
+        return self.maximum_request_size
+
+    def get_prune_requests(self, sheets: list[dict[str, Any]]) -> list[dict[str, Any]]:
         excess_sheets = len(sheets) - self.maximum_sheet_count
-        if excess_sheets > 0:
-            requests = []
-            for i in range(excess_sheets):
-                requests.append({
-                    "deleteSheet": {
-                        "sheetId": sheets[i]["properties"]["sheetId"]
-                    }
-                })
-            self.service.spreadsheets().batchUpdate(
-                spreadsheetId=self.spreadsheet_id,
-                body={"requests": requests}
-            ).execute()
+        return [
+            {"deleteSheet": {"sheetId": sheets[i]["properties"]["sheetId"]}}
+            for i in range(max(excess_sheets, 0))
+        ]
+
+    def chunk_requests(self, requests: list[dict[str, Any]]) -> Iterator[list[dict[str, Any]]]:
+        # A request that is too large on its own is still sent, alone
+        chunk = []
+        chunk_size = 0
+        for request in requests:
+            request_size = len(json.dumps(request))
+            if chunk and chunk_size + request_size > self.maximum_request_size:
+                yield chunk
+                chunk = []
+                chunk_size = 0
+            chunk.append(request)
+            chunk_size += request_size
+        if chunk:
+            yield chunk
+
+    def update_sheets(self, requests: list[dict[str, Any]], replies: list[dict[str, Any]]):
+        # Only addSheet has a reply worth reading; the others' are empty
+        for request, reply in zip(requests, replies):
+            if "addSheet" in request:
+                properties = reply["addSheet"]["properties"]
+                self.sheets[properties["sheetId"]] = {"properties": properties}
+            elif "deleteSheet" in request:
+                self.sheets.pop(request["deleteSheet"]["sheetId"], None)
+
+    def batch_update(self, requests: list[dict[str, Any]]) -> dict[str, Any]:
+        for attempt in range(self.num_retries + 1):
+            try:
+                return self.service.spreadsheets().batchUpdate(
+                    spreadsheetId=self.spreadsheet_id,
+                    body={"requests": requests}
+                ).execute()
+            except HttpError as e:
+                if e.resp.status != 429 or attempt == self.num_retries:
+                    raise
+                delay = random.uniform(0.5, 1) * min(2 ** attempt, 64)
+                logger.warning("Rate limited by the Sheets API; retrying in %.1fs", delay)
+                time.sleep(delay)
+
+    def execute_requests(self, requests: list[dict[str, Any]]):
+        for chunk in self.chunk_requests(requests):
+            response = self.batch_update(chunk)
+            self.update_sheets(chunk, response.get("replies", []))
+
+    def store_entries(self, entry_set: DispatchEntrySet):
+        self.execute_requests(self.get_store_requests(entry_set, self.sheets))
+
+    def store_entry_sets(self, entry_sets: Iterable[DispatchEntrySet], prune: bool = False):
+        sheets = list(self.sheets.values())
+        sheet_ids = set(self.sheets)
+        requests = []
+        for entry_set in entry_sets:
+            set_requests = self.get_store_requests(entry_set, sheet_ids)
+            if "addSheet" in set_requests[0]:
+                sheets.append(set_requests[0]["addSheet"])
+                sheet_ids.add(set_requests[0]["addSheet"]["properties"]["sheetId"])
+            requests.extend(set_requests)
+        if prune:
+            requests.extend(self.get_prune_requests(self.sort_sheets(sheets)))
+        if requests:
+            self.execute_requests(requests)
+
+    def prune(self):
+        requests = self.get_prune_requests(self.sorted_sheets)
+        if requests:
+            self.execute_requests(requests)
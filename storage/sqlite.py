@@ -0,0 +1,96 @@
+import logging, sqlite3
+from datetime import date, timedelta
+from functools import cached_property
+from pathlib import Path
+from typing import Optional, Union
+
+from icbot.config import settings
+from scraper import DispatchEntrySet
+from .base import BaseStorage
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStorage(BaseStorage):
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS entries (
+            entry_date TEXT NOT NULL,
+            dispatch_number INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            activity TEXT,
+            disposition TEXT,
+            details TEXT,
+            error TEXT,
+            PRIMARY KEY (entry_date, dispatch_number)
+        )""",
+        "CREATE INDEX IF NOT EXISTS entries_dispatch_number ON entries (dispatch_number)",
+        # Days are recorded separately so that a day with no entries still
+        # counts as stored
+        "CREATE TABLE IF NOT EXISTS days (entry_date TEXT PRIMARY KEY)"
+    ]
+
+    def __init__(
+        self,
+        *,
+        path: Optional[Union[str, Path]] = None,
+        retention_days: Optional[int] = None
+    ):
+        super().__init__()
+        self.path = Path(path) if path else settings.DATA_DIR / "icbot.sqlite3"
+        self.retention_days = retention_days
+
+    @cached_property
+    def connection(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        with connection:
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+        return connection
+
+    def get_latest_date_with_dispatch_ids(self) -> tuple[Optional[date], list[int]]:
+        rows = self.connection.execute("""
+            SELECT days.entry_date, entries.dispatch_number
+            FROM days LEFT JOIN entries ON entries.entry_date = days.entry_date
+            WHERE days.entry_date = (SELECT MAX(entry_date) FROM days)
+            ORDER BY entries.dispatch_number
+        """).fetchall()
+        if not rows:
+            return None, []
+        return (
+            date.fromisoformat(rows[0][0]),
+            [dispatch_number for _, dispatch_number in rows if dispatch_number is not None]
+        )
+
+    def store_entries(self, entry_set: DispatchEntrySet):
+        entry_date = entry_set.date.isoformat()
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO days (entry_date) VALUES (?)", (entry_date,)
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        entry_date,
+                        entry.dispatch_number,
+                        entry.url,
+                        entry.activity,
+                        entry.disposition,
+                        entry.details,
+                        str(entry.error) if entry.error else None
+                    ) for entry in entry_set.entries
+                )
+            )
+
+    def prune(self):
+        if self.retention_days is None:
+            return
+        cutoff = (settings.current_date - timedelta(days=self.retention_days)).isoformat()
+        with self.connection:
+            deleted_count = self.connection.execute(
+                "DELETE FROM entries WHERE entry_date < ?", (cutoff,)
+            ).rowcount
+            self.connection.execute("DELETE FROM days WHERE entry_date < ?", (cutoff,))
+        logger.debug("Pruned %s entries dated before %s", deleted_count, cutoff)
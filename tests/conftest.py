@@ -0,0 +1,16 @@
+import atexit, shutil, sys
+from tempfile import mkdtemp
+from types import ModuleType
+
+
+# icbot.config loads icbot.settings when it's first imported, so the tests'
+# settings are put in its place before any test module is collected, leaving
+# a deployment's own settings module (if any) untouched
+test_settings = ModuleType("icbot.settings")
+test_settings.DATA_DIR = mkdtemp(prefix="icbot-tests-")
+test_settings.STORAGE = {
+    "class": "storage.GoogleSheetsStorage",
+    "init_kwargs": {"spreadsheet_id": "test", "client_secrets_file": "client_secrets.json"}
+}
+sys.modules["icbot.settings"] = test_settings
+atexit.register(shutil.rmtree, test_settings.DATA_DIR, ignore_errors=True)
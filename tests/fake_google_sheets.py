@@ -0,0 +1,162 @@
+"""
+An in-process stand-in for the parts of the Google Sheets API used by
+``GoogleSheetsStorage``, which keeps count of the calls made and the size of
+their payloads, and can be made to fail calls with rate limit (429) errors.
+"""
+import json, random, re
+from collections import Counter
+from typing import Any, Callable, Optional
+
+from googleapiclient.errors import HttpError
+from httplib2 import Response
+
+RANGE_PATTERN = re.compile(r"^'(?P<title>(?:[^']|'')*)'!A:A$")
+
+
+class FakeRequest:
+    def __init__(
+        self,
+        service: "FakeSheetsService",
+        method: str,
+        handler: Callable[[], dict[str, Any]],
+        body: Optional[dict[str, Any]] = None
+    ):
+        self.service = service
+        self.method = method
+        self.handler = handler
+        self.body = body
+
+    def execute(self, num_retries: int = 0) -> dict[str, Any]:
+        # Like the real client, rate limited calls are retried up to
+        # num_retries times (but without the backoff)
+        for attempt in range(num_retries + 1):
+            self.service.calls[self.method] += 1
+            if self.body is not None:
+                self.service.request_bytes[self.method] += len(json.dumps(self.body))
+            if self.service.random.random() < self.service.rate_limit_error_rate:
+                self.service.rate_limit_errors[self.method] += 1
+                if attempt < num_retries:
+                    continue
+                raise HttpError(
+                    Response({"status": 429}),
+                    b'{"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}}'
+                )
+            response = self.handler()
+            self.service.response_bytes[self.method] += len(json.dumps(response))
+            return response
+
+
+class FakeValues:
+    def __init__(self, service: "FakeSheetsService"):
+        self.service = service
+
+    def get(self, spreadsheetId: str, range: str) -> FakeRequest:
+        return FakeRequest(self.service, "values.get", lambda: self.service.get_values(range))
+
+
+class FakeSpreadsheets:
+    def __init__(self, service: "FakeSheetsService"):
+        self.service = service
+
+    def get(self, spreadsheetId: str, fields: Optional[str] = None) -> FakeRequest:
+        return FakeRequest(self.service, "get", self.service.get_spreadsheet)
+
+    def values(self) -> FakeValues:
+        return FakeValues(self.service)
+
+    def batchUpdate(self, spreadsheetId: str, body: dict[str, Any]) -> FakeRequest:
+        return FakeRequest(
+            self.service, "batchUpdate", lambda: self.service.batch_update(body["requests"]), body
+        )
+
+
+class FakeSheetsService:
+    """
+    A single spreadsheet, whose cells are kept as plain strings. Pass it as
+    ``service`` to ``GoogleSheetsStorage``.
+    """
+    def __init__(self, rate_limit_error_rate: float = 0.0, seed: Optional[int] = None):
+        self.rate_limit_error_rate = rate_limit_error_rate
+        self.random = random.Random(seed)
+        # Sheet properties and rows by sheet ID, in sheet order
+        self.sheets: dict[int, dict[str, Any]] = {}
+        self.rows: dict[int, list[list[str]]] = {}
+        self.reset_counts()
+
+    def reset_counts(self):
+        # By API method
+        self.calls: Counter[str] = Counter()
+        self.request_bytes: Counter[str] = Counter()
+        self.response_bytes: Counter[str] = Counter()
+        self.rate_limit_errors: Counter[str] = Counter()
+
+    def spreadsheets(self) -> FakeSpreadsheets:
+        return FakeSpreadsheets(self)
+
+    def add_sheet(self, properties: dict[str, Any], rows: Optional[list[list[Any]]] = None):
+        sheet_id = properties.get("sheetId")
+        if sheet_id is None:
+            sheet_id = max(self.sheets, default=0) + 1
+        if sheet_id in self.sheets:
+            raise HttpError(Response({"status": 400}), f"Sheet {sheet_id} already exists".encode())
+        self.sheets[sheet_id] = {**properties, "sheetId": sheet_id, "index": len(self.sheets)}
+        self.rows[sheet_id] = [[str(value) for value in row] for row in rows or []]
+        return self.sheets[sheet_id]
+
+    def get_spreadsheet(self) -> dict[str, Any]:
+        return {"sheets": [{"properties": dict(properties)} for properties in self.sheets.values()]}
+
+    def get_values(self, range_: str) -> dict[str, Any]:
+        match = RANGE_PATTERN.match(range_)
+        title = match and match.group("title").replace("''", "'")
+        for sheet_id, properties in self.sheets.items():
+            if properties["title"] == title:
+                response = {"range": range_, "majorDimension": "ROWS"}
+                values = [row[:1] for row in self.rows[sheet_id]]
+                # Trailing empty rows are left out, as by the real API
+                while values and not values[-1]:
+                    values.pop()
+                if values:
+                    response["values"] = values
+                return response
+        raise HttpError(Response({"status": 400}), f"Unable to parse range: {range_}".encode())
+
+    @classmethod
+    def cell_to_string(cls, cell: dict[str, Any]) -> str:
+        value = cell.get("userEnteredValue", {})
+        if "numberValue" in value:
+            number = value["numberValue"]
+            return str(int(number)) if number == int(number) else str(number)
+        return str(value.get("stringValue", ""))
+
+    def batch_update(self, requests: list[dict[str, Any]]) -> dict[str, Any]:
+        # Requests are applied all together or not at all
+        sheets = dict(self.sheets)
+        rows = {sheet_id: list(sheet_rows) for sheet_id, sheet_rows in self.rows.items()}
+        replies = []
+        try:
+            for request in requests:
+                if "addSheet" in request:
+                    properties = self.add_sheet(request["addSheet"]["properties"])
+                    replies.append({"addSheet": {"properties": dict(properties)}})
+                    continue
+                if "appendCells" in request:
+                    sheet_id = request["appendCells"]["sheetId"]
+                    if sheet_id not in self.sheets:
+                        raise HttpError(Response({"status": 400}), f"No sheet {sheet_id}".encode())
+                    self.rows[sheet_id].extend(
+                        [self.cell_to_string(cell) for cell in row.get("values", [])]
+                        for row in request["appendCells"]["rows"]
+                    )
+                elif "deleteSheet" in request:
+                    sheet_id = request["deleteSheet"]["sheetId"]
+                    if sheet_id not in self.sheets:
+                        raise HttpError(Response({"status": 400}), f"No sheet {sheet_id}".encode())
+                    del self.sheets[sheet_id]
+                    del self.rows[sheet_id]
+                replies.append({})
+        except HttpError:
+            self.sheets = sheets
+            self.rows = rows
+            raise
+        return {"spreadsheetId": "fake", "replies": replies}
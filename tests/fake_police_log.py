@@ -0,0 +1,143 @@
+"""
+A stand-in for the police activity log site, serving generated activity logs
+and detail pages from a local aiohttp test server, with adjustable latency,
+error rate and page size.
+"""
+import asyncio, random
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import AsyncIterator, Iterable, Optional
+from urllib.parse import parse_qs
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from icbot.config import settings
+from .test_blotter import (
+    MOCK_BLOTTER_ENTRY_PAGE_TEMPLATE,
+    MOCK_BLOTTER_PAGE_TABLE_TEMPLATE,
+    MOCK_BLOTTER_PAGE_TEMPLATE
+)
+
+ACTIVITY_LOG_PATH = "/IcgovApps/police/ActivityLog"
+ROW_TEMPLATE = """<tr>
+        <td><a href="{path}/Details/{dispatch_number}">{dispatch_number}</a></td>
+        <td>{dispatch_number} Fake St</td>
+        <td>ACTIVITY {activity}</td>
+        <td>DISPOSITION {disposition}</td>
+        <td>{details}</td>
+    </tr>"""
+ENTRY_CONTENTS_TEMPLATE = """<dt>Dispatch Number</dt>
+<dd>{dispatch_number}</dd>
+<dt>Dispatch Time</dt>
+<dd>1/1/1970 1:00:00 AM</dd>
+<dt>Activity</dt>
+<dd>ACTIVITY {activity}</dd>
+<dt>Details</dt>
+<dd>{details}</dd>"""
+
+
+# The pages below are also used by the benchmarks. A dispatch's activity,
+# disposition and whether it has details follow from the last four digits of
+# its dispatch number
+
+def make_activity_log_page(dispatch_numbers: Iterable[int]) -> str:
+    return MOCK_BLOTTER_PAGE_TEMPLATE.format(
+        table_contents=MOCK_BLOTTER_PAGE_TABLE_TEMPLATE.format(table_contents="\n    ".join(
+            ROW_TEMPLATE.format(
+                path=ACTIVITY_LOG_PATH,
+                dispatch_number=dispatch_number,
+                activity=dispatch_number % 10000 % 40,
+                disposition=dispatch_number % 10000 % 12,
+                details="Y" if dispatch_number % 10000 % 3 else "N"
+            ) for dispatch_number in dispatch_numbers
+        ))
+    )
+
+
+def make_details_page(dispatch_number: int, details: Optional[str] = None) -> str:
+    return MOCK_BLOTTER_ENTRY_PAGE_TEMPLATE.format(entry_contents=ENTRY_CONTENTS_TEMPLATE.format(
+        dispatch_number=dispatch_number,
+        activity=dispatch_number % 10000 % 40,
+        details=f"Details of dispatch {dispatch_number}" if details is None else details
+    ))
+
+
+class FakePoliceLog:
+    def __init__(
+        self,
+        rows_per_day: int = 100,
+        latency: float = 0.0,
+        latency_jitter: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        self.rows_per_day = rows_per_day
+        # Every response is delayed by latency plus up to latency_jitter seconds
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        # The fraction of requests answered with a 503
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.app = web.Application()
+        self.app.router.add_route("*", ACTIVITY_LOG_PATH, self.handle_activity_log)
+        self.app.router.add_get(
+            ACTIVITY_LOG_PATH + "/Details/{dispatch_number}", self.handle_details
+        )
+
+    @classmethod
+    def get_dispatch_number(cls, for_date: date, i: int) -> int:
+        return int(for_date.strftime("%Y%m%d")) * 10000 + i
+
+    @classmethod
+    def parse_activity_date(cls, value: str) -> date:
+        # strptime doesn't know the unpadded directives, but doesn't need
+        # padding either
+        return datetime.strptime(
+            value, settings.POLICE_LOG_DATETIME_FORMAT.replace("%-", "%")
+        ).date()
+
+    def get_row_indices(self, for_date: date) -> Iterable[int]:
+        """
+        The rows listed for the date, by index (from which their dispatch
+        numbers are derived); override to change what's listed over time.
+        """
+        return range(self.rows_per_day)
+
+    async def respond(self, make_body) -> web.Response:
+        self.requests += 1
+        delay = self.latency + self.random.uniform(0, self.latency_jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.random.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=503)
+        return web.Response(text=make_body(), content_type="text/html")
+
+    async def handle_activity_log(self, request: web.Request) -> web.Response:
+        # The scraper sends the date as a form body, even with GET (for which
+        # aiohttp's request.post() doesn't read the body)
+        data = parse_qs((await request.read()).decode())
+        value = data.get("activityDate", [None])[0] or request.query.get("activityDate")
+        try:
+            for_date = self.parse_activity_date(value)
+        except (TypeError, ValueError):
+            return web.Response(status=400)
+        return await self.respond(lambda: make_activity_log_page(
+            self.get_dispatch_number(for_date, i) for i in self.get_row_indices(for_date)
+        ))
+
+    async def handle_details(self, request: web.Request) -> web.Response:
+        dispatch_number = int(request.match_info["dispatch_number"])
+        return await self.respond(lambda: make_details_page(dispatch_number))
+
+    @asynccontextmanager
+    async def serve(self) -> AsyncIterator[str]:
+        """
+        Runs the server for the duration of the context, yielding the URL of
+        the activity log.
+        """
+        async with TestServer(self.app) as server:
+            yield str(server.make_url(ACTIVITY_LOG_PATH))
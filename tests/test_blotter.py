@@ -2,7 +2,13 @@ from unittest import TestCase
 
 from bs4 import BeautifulSoup
 
-from blotter import BlotterEntry, UnexpectedPageLayout
+from blotter import (
+    BlotterEntry,
+    DetailsExtractor,
+    parse_blotter_page,
+    parse_details_page,
+    UnexpectedPageLayout
+)
 from icbot.config import settings
 
 
@@ -199,6 +205,33 @@ class BlotterEntryTestCase(TestCase):
             BlotterEntry.from_page(page)
         self.assertEqual(str(context.exception), "Could not parse dispatch URL from row 2")
 
+    def test_parse_blotter_page(self):
+        """
+        Tests that the tree-less extractor used on raw HTML gives the same
+        results and errors as ``BlotterEntry.from_page()``.
+        """
+        base_url = "http://test/police/log"
+        table = MOCK_BLOTTER_PAGE_TABLE.replace(
+            "<th>Activity</th>", "<th><b>Activity</b></th>"
+        ).replace("<td>BAR</td>", "<td>BAR &amp; GRILL</td>")
+        html = "<!-- <thead> --><p>Preamble</p>" + MOCK_BLOTTER_PAGE_TEMPLATE.format(
+            table_contents=table
+        ) + "<table><thead><tr><th>Other</th></tr></thead></table>"
+        with settings.override({"POLICE_LOG_URL": base_url}):
+            expected_entries = BlotterEntry.from_page(BeautifulSoup(html, "html.parser"))
+        entries = [BlotterEntry(**fields) for fields in parse_blotter_page(html, base_url)]
+        self.assertEqual(entries, expected_entries)
+        self.assertEqual(entries[1].activity, "BAR & GRILL")
+
+        with self.assertRaises(UnexpectedPageLayout) as context:
+            parse_blotter_page(html.replace("<th>Dispatch Number</th>", ""), base_url)
+        self.assertIn("dispatch number", str(context.exception))
+        with self.assertRaises(UnexpectedPageLayout) as context:
+            parse_blotter_page(html.replace("<a href=\"/456\">456</a>", "456"), base_url)
+        self.assertEqual(str(context.exception), "Could not parse dispatch URL from row 2")
+        with self.assertRaises(UnexpectedPageLayout):
+            parse_blotter_page("<html><body><p>Nothing to see here</p></body></html>", base_url)
+
     def test_set_details_from_page(self):
         entry = BlotterEntry(
             dispatch_number=123,
@@ -249,3 +282,31 @@ class BlotterEntryTestCase(TestCase):
         )
         with self.assertRaises(UnexpectedPageLayout):
             entry.set_details_from_page(page)
+
+    def test_details_extractor(self):
+        """
+        Tests that ``DetailsExtractor`` finds the details value however the
+        page is split into chunks, and reports that it is done as soon as it
+        has done so.
+        """
+        page = MOCK_BLOTTER_ENTRY_PAGE_TEMPLATE.format(
+            entry_contents=MOCK_BLOTTER_ENTRY_CONTENTS.replace("western", "western &amp; eastern")
+        )
+        for chunk_size in (1, 7, 16):
+            extractor = DetailsExtractor()
+            chunks = [page[i:i + chunk_size] for i in range(0, len(page), chunk_size)]
+            for fed_count, chunk in enumerate(chunks, 1):
+                if extractor.feed(chunk):
+                    break
+            self.assertLess(fed_count, len(chunks))
+            self.assertEqual(extractor.close(), "All quiet on the western & eastern front")
+        self.assertEqual(parse_details_page(page), "All quiet on the western & eastern front")
+        self.assertEqual(parse_details_page(MOCK_BLOTTER_ENTRY_PAGE_TEMPLATE.format(
+            entry_contents=MOCK_BLOTTER_ENTRY_CONTENTS.replace("All quiet on the western front", "\t\r\n")
+        )), "")
+        with self.assertRaises(UnexpectedPageLayout):
+            parse_details_page(MOCK_BLOTTER_ENTRY_PAGE_TEMPLATE.format(
+                entry_contents=MOCK_BLOTTER_ENTRY_CONTENTS.replace("<dt>Details</dt>", "<dt>asdf</dt>")
+            ))
+        with self.assertRaises(UnexpectedPageLayout):
+            parse_details_page("<html><body><p>Nothing to see here</p></body></html>")
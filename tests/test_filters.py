@@ -0,0 +1,71 @@
+import re
+from copy import deepcopy
+from unittest import TestCase
+
+from icbot.config import ConfigurationError, settings
+from icbot.config.filters import BlockingFilters, CategoryMatcher, FilterMatch
+
+
+class CategoryMatcherTestCase(TestCase):
+    def test_search(self):
+        patterns = [
+            re.compile("^FOO", re.I),
+            re.compile("(EMPL ERROR|UNK CAUSE) ALARM", re.I),
+            re.compile(r"(?P<word>\w+) \1"),
+            re.compile("bar")
+        ]
+        matcher = CategoryMatcher(patterns)
+        self.assertEqual(len(matcher.combined), 2)
+        self.assertEqual(matcher.standalone, [patterns[2]])
+        self.assertIs(matcher.search("foo fighters"), patterns[0])
+        self.assertIs(matcher.search("UNK CAUSE ALARM"), patterns[1])
+        self.assertIs(matcher.search("again again"), patterns[2])
+        self.assertIs(matcher.search("crowbar"), patterns[3])
+        self.assertIsNone(matcher.search("CROWBAR"))
+        self.assertIsNone(matcher.search("the foo"))
+        self.assertIsNone(CategoryMatcher([]).search("anything"))
+
+
+class BlockingFiltersTestCase(TestCase):
+    def test_setting(self):
+        with settings.override({
+            "BLOCKING_FILTERS": {
+                "ACTIVITIES": ["^FOO"],
+                "DISPOSITIONS": ["UNKNOWN"],
+                "DETAILS": ["QUIET"]
+            }
+        }):
+            filters = settings.BLOCKING_FILTERS
+            self.assertIsInstance(filters, BlockingFilters)
+            self.assertEqual(filters["ACTIVITIES"], [re.compile("^FOO", re.I)])
+            self.assertEqual(
+                filters.match("DETAILS", "all quiet"),
+                FilterMatch("DETAILS", re.compile("QUIET", re.I))
+            )
+            self.assertIsNone(filters.match("DETAILS", "all loud"))
+            self.assertEqual(str(filters.match("DETAILS", "all quiet")), "DETAILS filter 'QUIET'")
+            copied = deepcopy(filters)
+            self.assertEqual(copied.match("ACTIVITIES", "FOO").category, "ACTIVITIES")
+        self.assertNotIn(re.compile("^FOO", re.I), settings.BLOCKING_FILTERS["ACTIVITIES"])
+        with self.assertRaises(ConfigurationError):
+            with settings.override({"BLOCKING_FILTERS": {"ACTIVITIES": ["("]}}):
+                pass
+
+    def test_match_summary(self):
+        filters = BlockingFilters({
+            "ACTIVITIES": [re.compile("^FOO")],
+            "DISPOSITIONS": [re.compile("UNKNOWN")],
+            "DETAILS": []
+        })
+        filters.CACHE_SIZE = 2
+        self.assertEqual(filters.match_summary("FOO", "UNKNOWN").category, "ACTIVITIES")
+        self.assertEqual(filters.match_summary("BAR", "UNKNOWN").category, "DISPOSITIONS")
+        self.assertIsNone(filters.match_summary("BAR", "COMPLETED"))
+        self.assertEqual((filters.cache_hits, filters.cache_misses), (0, 3))
+        self.assertIsNone(filters.match_summary("BAR", "COMPLETED"))
+        self.assertEqual(filters.match_summary("BAR", "UNKNOWN").category, "DISPOSITIONS")
+        self.assertEqual((filters.cache_hits, filters.cache_misses), (2, 3))
+        # The least recently used decision was evicted
+        self.assertEqual(filters.match_summary("FOO", "UNKNOWN").category, "ACTIVITIES")
+        self.assertEqual((filters.cache_hits, filters.cache_misses), (2, 4))
+        self.assertEqual(len(filters._decisions), 2)
@@ -0,0 +1,179 @@
+from datetime import date
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from googleapiclient.errors import HttpError
+
+from scraper import DispatchEntrySet
+from storage.google_sheets import GoogleSheetsStorage
+from .fake_google_sheets import FakeSheetsService
+from .test_sqlite_storage import make_entry
+
+
+def make_sheet_data(sheet_date: date) -> dict:
+    return {"properties": {
+        "sheetId": int(sheet_date.strftime("%Y%m%d")),
+        "title": sheet_date.strftime(GoogleSheetsStorage.DATE_FORMAT)
+    }}
+
+
+class GoogleSheetsStorageTestCase(TestCase):
+    def make_storage(self, sheet_dates: list[date], **kwargs) -> GoogleSheetsStorage:
+        service = MagicMock()
+        service.spreadsheets.return_value.get.return_value.execute.return_value = {
+            "sheets": [make_sheet_data(sheet_date) for sheet_date in sheet_dates]
+        }
+        return GoogleSheetsStorage(
+            spreadsheet_id="abc",
+            client_secrets_file="",
+            service=service,
+            **kwargs
+        )
+
+    def get_batch_update_requests(self, storage: GoogleSheetsStorage) -> list[list[dict]]:
+        return [
+            call.kwargs["body"]["requests"]
+            for call in storage.service.spreadsheets.return_value.batchUpdate.call_args_list
+        ]
+
+    def test_store_entry_sets(self):
+        storage = self.make_storage(
+            [date(2023, 2, day) for day in (12, 11, 13)],
+            maximum_sheet_count=4
+        )
+        storage.store_entry_sets([
+            DispatchEntrySet(date=date(2023, 2, 13), entries=[make_entry(1)]),
+            DispatchEntrySet(date=date(2023, 2, 14), entries=[make_entry(2), make_entry(3)]),
+            DispatchEntrySet(date=date(2023, 2, 15), entries=[])
+        ], prune=True)
+        batches = self.get_batch_update_requests(storage)
+        self.assertEqual(len(batches), 1)
+        self.assertEqual([list(request) for request in batches[0]], [
+            ["appendCells"],
+            ["addSheet"], ["appendCells"],
+            ["addSheet"], ["appendCells"],
+            ["deleteSheet"]
+        ])
+        self.assertEqual(batches[0][0]["appendCells"]["sheetId"], 20230213)
+        self.assertEqual(len(batches[0][0]["appendCells"]["rows"]), 1)
+        self.assertEqual(batches[0][1]["addSheet"]["properties"]["title"], "2023-02-14")
+        # Header row plus two entries
+        self.assertEqual(len(batches[0][2]["appendCells"]["rows"]), 3)
+        self.assertEqual(batches[0][5], {"deleteSheet": {"sheetId": 20230211}})
+
+    def test_store_entry_sets__chunked(self):
+        storage = self.make_storage([date(2023, 2, 12)], maximum_request_size=2000)
+        storage.store_entry_sets([
+            DispatchEntrySet(
+                date=date(2023, 2, day),
+                entries=[make_entry(i) for i in range(3)]
+            ) for day in (13, 14, 15)
+        ])
+        batches = self.get_batch_update_requests(storage)
+        self.assertGreater(len(batches), 1)
+        self.assertEqual(sum(len(batch) for batch in batches), 6)
+        # Nothing to store or prune means no calls at all
+        storage = self.make_storage([date(2023, 2, 12)])
+        storage.store_entry_sets([], prune=True)
+        storage.service.spreadsheets.return_value.batchUpdate.assert_not_called()
+
+    def test_get_latest_date_with_dispatch_ids(self):
+        storage = self.make_storage([date(2023, 2, 14), date(2023, 2, 15)])
+        storage.service.spreadsheets.return_value.values.return_value.get.return_value.execute.return_value = {
+            "values": [["Dispatch ID"], ["123"], ["456"], [], ["789"]]
+        }
+        self.assertEqual(
+            storage.get_latest_date_with_dispatch_ids(),
+            (date(2023, 2, 15), [123, 456])
+        )
+        storage.service.spreadsheets.return_value.get.assert_called_once_with(
+            spreadsheetId="abc", fields="sheets.properties"
+        )
+        storage.service.spreadsheets.return_value.values.return_value.get.assert_called_once_with(
+            spreadsheetId="abc", range="'2023-02-15'!A:A"
+        )
+
+    def test_sheet_registry(self):
+        """
+        Tests that the sheet registry is kept current from batchUpdate replies,
+        so that neither storing nor pruning needs the spreadsheet again.
+        """
+        storage = self.make_storage([date(2023, 2, 13), date(2023, 2, 14)], maximum_sheet_count=2)
+        batch_update = storage.service.spreadsheets.return_value.batchUpdate
+
+        def mock_batch_update(spreadsheetId, body):
+            replies = []
+            for request in body["requests"]:
+                if "addSheet" in request:
+                    properties = {**request["addSheet"]["properties"], "index": 0}
+                    replies.append({"addSheet": {"properties": properties}})
+                else:
+                    replies.append({})
+            return MagicMock(**{"execute.return_value": {"replies": replies}})
+
+        batch_update.side_effect = mock_batch_update
+        storage.store_entries(DispatchEntrySet(date=date(2023, 2, 15), entries=[make_entry(1)]))
+        self.assertEqual(list(storage.sheets), [20230213, 20230214, 20230215])
+        self.assertEqual(storage.sheets[20230215]["properties"]["index"], 0)
+        # The new sheet is known to exist, so no addSheet this time
+        storage.store_entries(DispatchEntrySet(date=date(2023, 2, 15), entries=[make_entry(2)]))
+        self.assertEqual(list(batch_update.call_args.kwargs["body"]["requests"][0]), ["appendCells"])
+        storage.prune()
+        self.assertEqual(
+            batch_update.call_args.kwargs["body"]["requests"],
+            [{"deleteSheet": {"sheetId": 20230213}}]
+        )
+        self.assertEqual(
+            [sheet_data["properties"]["title"] for sheet_data in storage.sorted_sheets],
+            ["2023-02-14", "2023-02-15"]
+        )
+        storage.prune()
+        self.assertEqual(batch_update.call_count, 3)
+        storage.service.spreadsheets.return_value.get.assert_called_once()
+
+    def test_fake_service(self):
+        """
+        Tests storing, pruning and reading back entries through a stand-in for
+        the API, counting the calls made and riding out rate limit errors.
+        """
+        service = FakeSheetsService(rate_limit_error_rate=0.3, seed=3)
+        service.add_sheet({"sheetId": 0, "title": "Sheet1"})
+        storage = GoogleSheetsStorage(
+            spreadsheet_id="abc",
+            client_secrets_file="",
+            maximum_sheet_count=2,
+            num_retries=10,
+            service=service
+        )
+        with patch("storage.google_sheets.time.sleep") as mock_sleep:
+            storage.store_entry_sets([
+                DispatchEntrySet(
+                    date=date(2023, 2, day),
+                    entries=[make_entry(day * 10 + i) for i in range(3)]
+                ) for day in (13, 14)
+            ])
+            storage.store_entries(DispatchEntrySet(date=date(2023, 2, 15), entries=[make_entry(151)]))
+            storage.prune()
+            self.assertEqual(
+                storage.get_latest_date_with_dispatch_ids(), (date(2023, 2, 15), [151])
+            )
+        self.assertEqual(
+            [properties["title"] for properties in service.sheets.values()],
+            ["2023-02-14", "2023-02-15"]
+        )
+        self.assertEqual(service.rows[20230214][1], [
+            "140", "http://test/140", "FOO", "COMPLETED", "All quiet on the western front"
+        ])
+        self.assertGreater(sum(service.rate_limit_errors.values()), 0)
+        self.assertEqual(mock_sleep.call_count, service.rate_limit_errors["batchUpdate"])
+        successful_calls = service.calls - service.rate_limit_errors
+        self.assertEqual(successful_calls, {
+            "get": 1, "batchUpdate": 3, "values.get": 1
+        })
+        self.assertGreater(service.request_bytes["batchUpdate"], 0)
+        # Out of retries
+        service.rate_limit_error_rate = 1
+        with self.assertRaises(HttpError) as context, patch("storage.google_sheets.time.sleep"):
+            storage.store_entries(DispatchEntrySet(date=date(2023, 2, 15), entries=[make_entry(152)]))
+        self.assertEqual(context.exception.resp.status, 429)
+        self.assertEqual(len(service.rows[20230215]), 2)
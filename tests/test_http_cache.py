@@ -0,0 +1,65 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from utils.http_cache import ResponseCache
+
+
+class ResponseCacheTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.path = Path(self.temp_dir.name) / "cache.sqlite3"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_get_and_put(self):
+        cache = ResponseCache(self.path, ttl=60)
+        self.assertIsNone(cache.get("http://foo.bar/1"))
+        cache.put("http://foo.bar/1", "first", etag='"abc"', last_modified="yesterday")
+        cache.close()
+        # Entries survive reopening the cache
+        cache = ResponseCache(self.path, ttl=60)
+        response = cache.get("http://foo.bar/1")
+        self.assertEqual(response.body, "first")
+        self.assertTrue(cache.is_fresh(response))
+        self.assertEqual(response.get_validator_headers(), {
+            "If-None-Match": '"abc"',
+            "If-Modified-Since": "yesterday"
+        })
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+        with patch("utils.http_cache.time.time", return_value=response.stored_at + 61):
+            response = cache.get("http://foo.bar/1")
+            self.assertFalse(cache.is_fresh(response))
+            cache.revalidate("http://foo.bar/1")
+        self.assertEqual((cache.hits, cache.misses, cache.revalidations), (1, 1, 1))
+        self.assertGreater(cache.get("http://foo.bar/1").stored_at, response.stored_at)
+        cache.close()
+
+    def test_eviction(self):
+        cache = ResponseCache(self.path, max_size=10)
+        with patch("utils.http_cache.time.time", side_effect=range(100)):
+            cache.put("http://foo.bar/1", "aaaa")
+            cache.put("http://foo.bar/2", "bbbb")
+            cache.get("http://foo.bar/1")
+            cache.put("http://foo.bar/3", "cccc")
+            self.assertEqual(cache.evictions, 1)
+            self.assertEqual(cache.total_size, 8)
+            self.assertIsNone(cache.get("http://foo.bar/2"))
+            self.assertEqual(cache.get("http://foo.bar/1").body, "aaaa")
+            # Replacing an entry doesn't count its old size
+            cache.put("http://foo.bar/3", "cc")
+            self.assertEqual(cache.total_size, 6)
+            self.assertEqual(cache.evictions, 1)
+        cache.close()
+
+    def test_delete(self):
+        cache = ResponseCache(self.path)
+        cache.put("http://foo.bar/1", "aaaa")
+        cache.put("http://foo.bar/2", "bbbb")
+        cache.delete("http://foo.bar/1")
+        cache.delete("http://foo.bar/3")
+        self.assertIsNone(cache.get("http://foo.bar/1"))
+        self.assertEqual(cache.total_size, 4)
+        cache.close()
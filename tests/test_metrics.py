@@ -0,0 +1,56 @@
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from icbot.config import settings
+from utils.metrics import Histogram, Metrics
+
+
+class MetricsTestCase(TestCase):
+    def test_histogram(self):
+        histogram = Histogram(buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.get_cumulative_counts()), [
+            (0.1, 2), (1, 3), (float("inf"), 4)
+        ])
+        self.assertEqual((histogram.sum, histogram.count), (2.65, 4))
+
+    def test_export(self):
+        metrics = Metrics()
+        metrics.increment("entries_stored", 3)
+        metrics.increment("entries_stored")
+        metrics.set_gauge("last_run_success", 1)
+        with patch("utils.metrics.time.perf_counter", side_effect=[10, 10.2]):
+            with self.assertRaises(ValueError):
+                # Failed stages are timed too
+                with metrics.timer("prune"):
+                    raise ValueError
+        prometheus = metrics.to_prometheus().splitlines()
+        self.assertEqual(prometheus[:4], [
+            "# TYPE icbot_entries_stored_total counter",
+            "icbot_entries_stored_total 4",
+            "# TYPE icbot_last_run_success gauge",
+            "icbot_last_run_success 1"
+        ])
+        self.assertIn("# TYPE icbot_prune_seconds histogram", prometheus)
+        self.assertIn('icbot_prune_seconds_bucket{le="0.1"} 0', prometheus)
+        self.assertIn('icbot_prune_seconds_bucket{le="0.25"} 1', prometheus)
+        self.assertIn('icbot_prune_seconds_bucket{le="+Inf"} 1', prometheus)
+        self.assertIn("icbot_prune_seconds_count 1", prometheus)
+        with TemporaryDirectory() as temp_dir:
+            with settings.override({"DATA_DIR": temp_dir, "METRICS_FORMAT": "json"}):
+                metrics.write_to_data_dir()
+            with open(Path(temp_dir, "icbot_metrics.json")) as f:
+                data = json.load(f)
+            self.assertEqual(data["counters"], {"entries_stored": 4})
+            self.assertEqual(data["histograms"]["prune_seconds"]["buckets"]["inf"], 1)
+            with settings.override({"DATA_DIR": temp_dir, "METRICS_FORMAT": "prometheus"}):
+                metrics.write_to_data_dir()
+            self.assertEqual(
+                Path(temp_dir, "icbot_metrics.prom").read_text(), metrics.to_prometheus()
+            )
+            with settings.override({"METRICS_FORMAT": None}):
+                self.assertIsNone(Metrics.from_settings())
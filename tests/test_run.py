@@ -0,0 +1,416 @@
+import asyncio, re, threading, time
+from datetime import date
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch, PropertyMock
+
+from icbot.config import settings
+from run import fill_through_date_async, HighWaterMark, profile_run, run_daemon_async
+from scraper import DispatchEntrySet, Scraper
+from storage.google_sheets import GoogleSheetsStorage
+from storage.sqlite import SQLiteStorage
+from storage.base import AsyncBaseStorage, BaseStorage, get_async_storage, ThreadedStorage
+from utils.page_fingerprints import PageFingerprints
+from utils.profiling import RunProfiler
+from .fake_google_sheets import FakeSheetsService
+from .fake_police_log import FakePoliceLog
+from .test_sqlite_storage import make_entry
+
+
+class MockStorage(AsyncBaseStorage):
+    def __init__(self, latest_date: date):
+        self.latest_date = latest_date
+        self.stored: list[list[DispatchEntrySet]] = []
+        self.pruned = False
+
+    async def get_latest_date_with_dispatch_ids(self):
+        return self.latest_date, [1]
+
+    async def store_entries(self, entry_set):
+        raise NotImplementedError
+
+    async def store_entry_sets(self, entry_sets, prune=False):
+        self.stored.append(list(entry_sets))
+        self.pruned = self.pruned or prune
+
+    async def prune(self):
+        self.pruned = True
+
+
+class MockSyncStorage(BaseStorage):
+    def __init__(self):
+        super().__init__()
+        self.stored = []
+        self.pruned = False
+        self.thread_ids = set()
+
+    def get_latest_date_with_dispatch_ids(self):
+        self.thread_ids.add(threading.get_ident())
+        return date(2023, 2, 1), []
+
+    def store_entries(self, entry_set):
+        self.thread_ids.add(threading.get_ident())
+        self.stored.append(entry_set)
+
+    def prune(self):
+        self.pruned = True
+
+
+class FillThroughDateTestCase(IsolatedAsyncioTestCase):
+    async def test_pipeline(self):
+        """
+        Tests that days are stored in date order, each as soon as it and the
+        days before it have been scraped, while later days are still being
+        scraped.
+        """
+        storage = MockStorage(date(2023, 2, 1))
+        fetched_dates = []
+        day_2_fetched = asyncio.Event()
+        day_3_stored = asyncio.Event()
+        store_entry_sets = storage.store_entry_sets
+
+        async def mock_store_entry_sets(entry_sets, prune=False):
+            await store_entry_sets(entry_sets, prune)
+            if any(entry_set.date.day == 3 for entry_set in entry_sets):
+                day_3_stored.set()
+
+        storage.store_entry_sets = mock_store_entry_sets
+
+        async def mock_fetch(for_date, skip_ids, scraper):
+            self.assertIn(1, skip_ids)
+            if for_date.day == 1:
+                # Finishes after the day after it
+                await asyncio.wait_for(day_2_fetched.wait(), 1)
+            elif for_date.day == 4:
+                # The first days are stored (except the unchanged one) while
+                # this one is still being scraped
+                await asyncio.wait_for(day_3_stored.wait(), 1)
+                self.assertEqual(
+                    [entry_set.date.day for entry_sets in storage.stored for entry_set in entry_sets],
+                    [1, 3]
+                )
+            fetched_dates.append(for_date)
+            if for_date.day == 2:
+                day_2_fetched.set()
+            return DispatchEntrySet(
+                date=for_date,
+                entries=[make_entry(for_date.day * 10)],
+                unchanged=for_date.day == 2
+            )
+
+        with patch("scraper.fetch_dispatch_entries", side_effect=mock_fetch), \
+                settings.override({"MAX_CONCURRENT_DAYS": 2}):
+            scraper = Scraper()
+            await fill_through_date_async(date(2023, 2, 5), storage, scraper, prune=True)
+        stored_dates = [entry_set.date.day for entry_sets in storage.stored for entry_set in entry_sets]
+        self.assertEqual(stored_dates, [1, 3, 4, 5])
+        self.assertEqual(fetched_dates[:2], [date(2023, 2, 2), date(2023, 2, 1)])
+        self.assertEqual(len(fetched_dates), 5)
+        self.assertTrue(storage.pruned)
+        self.assertEqual(
+            scraper.metrics.histograms["store_entries_seconds"].count, len(storage.stored)
+        )
+        self.assertEqual(scraper.metrics.histograms["prune_seconds"].count, 1)
+        self.assertEqual(scraper.metrics.counters["entries_stored"], 4)
+
+    async def test_pipeline__failure(self):
+        storage = MockStorage(date(2023, 2, 1))
+
+        async def mock_fetch(for_date, skip_ids, scraper):
+            if for_date.day == 3:
+                raise RuntimeError("Boom")
+            return DispatchEntrySet(date=for_date, entries=[])
+
+        with patch("scraper.fetch_dispatch_entries", side_effect=mock_fetch), \
+                settings.override({"MAX_CONCURRENT_DAYS": 1}):
+            with self.assertRaises(RuntimeError):
+                await fill_through_date_async(date(2023, 2, 5), storage, prune=True)
+        # Days before the failure were still stored
+        self.assertEqual(
+            [entry_set.date.day for entry_sets in storage.stored for entry_set in entry_sets],
+            [1, 2]
+        )
+        self.assertFalse(storage.pruned)
+
+    def make_sheets_storage(self) -> tuple[FakeSheetsService, GoogleSheetsStorage, list]:
+        service = FakeSheetsService()
+        service.add_sheet({"sheetId": 20230201, "title": "2023-02-01"}, [["Dispatch ID"], [1]])
+        sync_storage = GoogleSheetsStorage(
+            spreadsheet_id="abc", client_secrets_file="", maximum_sheet_count=10, service=service
+        )
+        batches = []
+        store_entry_sets = sync_storage.store_entry_sets
+
+        def mock_store_entry_sets(entry_sets, prune=False):
+            batches.append(([entry_set.date.day for entry_set in entry_sets], prune))
+            store_entry_sets(entry_sets, prune)
+
+        sync_storage.store_entry_sets = mock_store_entry_sets
+        return service, sync_storage, batches
+
+    async def mock_fetch(self, for_date, skip_ids, scraper):
+        return DispatchEntrySet(date=for_date, entries=[make_entry(for_date.day * 10)])
+
+    async def test_pipeline__batch_writes(self):
+        """
+        Tests that storage that prefers batched writes is given up to
+        STORAGE_BATCH_DAYS days at a time, with a batchUpdate for each, while
+        later days are still being scraped, and that pruning goes along with
+        the last batch.
+        """
+        service, sync_storage, batches = self.make_sheets_storage()
+        storage = get_async_storage(sync_storage)
+        self.assertTrue(storage.batch_writes)
+        fetched_dates = []
+
+        async def mock_fetch(for_date, skip_ids, scraper):
+            fetched_dates.append(for_date)
+            if for_date.day == 15:
+                # The first batch was stored before the last day was scraped
+                self.assertTrue(batches)
+            return await self.mock_fetch(for_date, skip_ids, scraper)
+
+        with patch("scraper.fetch_dispatch_entries", side_effect=mock_fetch), \
+                settings.override({"MAX_CONCURRENT_DAYS": 1, "STORAGE_BATCH_DAYS": 5}):
+            await fill_through_date_async(date(2023, 2, 15), storage, prune=True)
+        await storage.close()
+        self.assertEqual(len(fetched_dates), 15)
+        self.assertEqual(batches, [
+            (list(range(1, 6)), False), (list(range(6, 11)), False), (list(range(11, 16)), True)
+        ])
+        self.assertEqual(service.calls["batchUpdate"], 3)
+        self.assertEqual(
+            [properties["title"] for properties in service.sheets.values()],
+            [f"2023-02-{day:02}" for day in range(6, 16)]
+        )
+
+    async def test_pipeline__batch_writes_size(self):
+        """
+        Tests that a batch is stored early rather than grow too large for a
+        single batchUpdate.
+        """
+        service, sync_storage, batches = self.make_sheets_storage()
+        day_size = sync_storage.get_write_size(await self.mock_fetch(date(2023, 2, 10), [], None))
+        sync_storage.maximum_request_size = day_size * 3
+        storage = get_async_storage(sync_storage)
+        with patch("scraper.fetch_dispatch_entries", side_effect=self.mock_fetch):
+            await fill_through_date_async(date(2023, 2, 10), storage, prune=True)
+        await storage.close()
+        self.assertEqual(
+            batches,
+            [([1, 2, 3], False), ([4, 5, 6], False), ([7, 8, 9], False), ([10], True)]
+        )
+        self.assertEqual(service.calls["batchUpdate"], 4)
+
+    async def test_threaded_storage(self):
+        storage = MockStorage(date(2023, 2, 1))
+        self.assertIs(get_async_storage(storage), storage)
+        sync_storage = MockSyncStorage()
+        async_storage = get_async_storage(sync_storage)
+        self.assertIsInstance(async_storage, ThreadedStorage)
+        self.assertEqual(
+            await async_storage.get_latest_date_with_dispatch_ids(),
+            (date(2023, 2, 1), [])
+        )
+        await async_storage.store_entry_sets([
+            DispatchEntrySet(date=date(2023, 2, day), entries=[]) for day in (1, 2)
+        ], prune=True)
+        self.assertEqual(len(sync_storage.stored), 2)
+        self.assertTrue(sync_storage.pruned)
+        # Calls were made off the event loop's thread
+        self.assertNotEqual(sync_storage.thread_ids, {threading.get_ident()})
+        await async_storage.close()
+
+
+class DictStorage(AsyncBaseStorage):
+    def __init__(self, entries: dict[date, list[int]]):
+        self.entries = entries
+        self.prune_count = 0
+
+    async def get_latest_date_with_dispatch_ids(self):
+        if not self.entries:
+            return None, []
+        latest_date = max(self.entries)
+        return latest_date, list(self.entries[latest_date])
+
+    async def store_entries(self, entry_set):
+        self.entries.setdefault(entry_set.date, []).extend(
+            entry.dispatch_number for entry in entry_set.entries
+        )
+
+    async def prune(self):
+        self.prune_count += 1
+
+
+class DaemonTestCase(IsolatedAsyncioTestCase):
+    def test_high_water_mark(self):
+        self.assertIn(5, HighWaterMark(5))
+        self.assertNotIn(6, HighWaterMark(5))
+        self.assertIn(8, HighWaterMark(5, {8}))
+        self.assertNotIn("5", HighWaterMark(5))
+
+    async def test_run_daemon(self):
+        """
+        Tests that only dispatches above the high-water mark are scraped when
+        polling, and that the previous day is finalized after midnight.
+        """
+        storage = DictStorage({date(2023, 2, 14): [1, 2]})
+        # The dispatch numbers listed on each day's activity log, as of each poll
+        listed = {
+            date(2023, 2, 14): [[1, 2, 3]],
+            # 6 is listed late, after higher numbers
+            date(2023, 2, 15): [[4, 5], [4, 5, 7, 8], [4, 5, 6, 7, 8, 9]]
+        }
+        polls = [date(2023, 2, 15)] * 3 + [date(2023, 2, 16)]
+        fetched = []
+        stop_event = asyncio.Event()
+
+        async def mock_fetch(for_date, skip_ids, scraper):
+            numbers = listed.get(for_date, [[]])
+            numbers = numbers.pop(0) if len(numbers) > 1 else numbers[0]
+            entries = [make_entry(n) for n in numbers if n not in skip_ids]
+            fetched.append((for_date.day, [entry.dispatch_number for entry in entries]))
+            return DispatchEntrySet(
+                date=for_date, entries=entries, max_dispatch_number=max(numbers, default=None)
+            )
+
+        def get_current_date():
+            if len(polls) == 1:
+                stop_event.set()
+            return polls.pop(0) if len(polls) > 1 else polls[0]
+
+        with patch("scraper.fetch_dispatch_entries", side_effect=mock_fetch), \
+                patch("run.fetch_dispatch_entries", side_effect=mock_fetch), \
+                patch.object(type(settings), "current_date", new_callable=PropertyMock) as current_date, \
+                settings.override({"DAEMON_POLL_INTERVAL": 0.01, "DAEMON_POLL_JITTER": 0}):
+            current_date.side_effect = get_current_date
+            scraper = Scraper()
+            await run_daemon_async(storage, scraper, stop_event=stop_event)
+        self.assertEqual(fetched, [
+            # Catching up through today on starting
+            (14, [3]), (15, [4, 5]),
+            # Polls, which skip everything up to the high-water mark
+            (15, [7, 8]), (15, [9]),
+            # After midnight, the late entry is picked up when finalizing
+            (15, [6]), (16, [])
+        ])
+        self.assertEqual(storage.entries, {
+            date(2023, 2, 14): [1, 2, 3],
+            date(2023, 2, 15): [4, 5, 7, 8, 9, 6],
+            date(2023, 2, 16): []
+        })
+        self.assertEqual(storage.prune_count, 2)
+        self.assertEqual(scraper.metrics.histograms["poll_seconds"].count, 4)
+
+
+class DaemonConnectionTestCase(IsolatedAsyncioTestCase):
+    async def test_run_daemon__late_entry(self):
+        """
+        Tests, against a stand-in for the site and with activity log
+        fingerprints recorded, that an entry listed late (below the high-water
+        mark) is stored when its day is finalized after midnight.
+        """
+        # The rows listed for the 15th as of each poll (and after)
+        listings = [[1, 2], [1, 2, 5], [1, 2, 4, 5]]
+        polls = [date(2023, 2, 15)] * 3 + [date(2023, 2, 16)]
+        poll_count = 0
+        stop_event = asyncio.Event()
+
+        class FakePoliceLogOverTime(FakePoliceLog):
+            def get_row_indices(self, for_date):
+                if for_date != date(2023, 2, 15):
+                    return [1]
+                return listings[min(poll_count, len(listings)) - 1]
+
+        def get_current_date():
+            nonlocal poll_count
+            poll_count += 1
+            if poll_count == len(polls):
+                stop_event.set()
+            return polls[poll_count - 1]
+
+        storage = DictStorage({date(2023, 2, 14): []})
+        async with FakePoliceLogOverTime().serve() as url:
+            with TemporaryDirectory() as data_dir, settings.override({
+                "POLICE_LOG_URL": url,
+                "BLOCKING_FILTERS": {"ACTIVITIES": [], "DISPOSITIONS": [], "DETAILS": []},
+                "DAEMON_POLL_INTERVAL": 0.01,
+                "DAEMON_POLL_JITTER": 0
+            }), patch.object(type(settings), "current_date", new_callable=PropertyMock) as current_date:
+                current_date.side_effect = get_current_date
+                scraper = Scraper(
+                    requests_per_second_per_host=0,
+                    fingerprints=PageFingerprints(Path(data_dir) / "fingerprints.json")
+                )
+                await run_daemon_async(storage, scraper, stop_event=stop_event)
+        self.assertEqual(storage.entries[date(2023, 2, 15)], [
+            FakePoliceLog.get_dispatch_number(date(2023, 2, 15), i) for i in (1, 2, 5, 4)
+        ])
+
+
+class ProfileRunTestCase(TestCase):
+    def test_profile_run(self):
+        async def mock_fetch(for_date, skip_ids, scraper):
+            if for_date.day == 2:
+                # Blocks the event loop
+                time.sleep(0.1)
+            return DispatchEntrySet(date=for_date, entries=[make_entry(for_date.day)])
+
+        with TemporaryDirectory() as data_dir, \
+                settings.override({"DATA_DIR": data_dir}), \
+                patch("scraper.fetch_dispatch_entries", side_effect=mock_fetch), \
+                patch.object(type(settings), "current_date", new_callable=PropertyMock) as current_date:
+            current_date.return_value = date(2023, 2, 3)
+            # Usable only from the thread its connection was opened on
+            storage = SQLiteStorage(retention_days=1)
+            storage.store_entries(DispatchEntrySet(date=date(2023, 2, 1), entries=[]))
+            storage.connection.close()
+            del storage.connection
+            profile_run(date(2023, 2, 3), storage, slow_callback_duration=0.05)
+            report_dirs = list(Path(data_dir, "profiles").iterdir())
+            self.assertEqual(len(report_dirs), 1)
+            self.assertEqual(sorted(path.name for path in report_dirs[0].iterdir()), [
+                "fill_through_date.prof",
+                "fill_through_date.tracemalloc",
+                "prune.prof",
+                "prune.tracemalloc",
+                "report.txt"
+            ])
+            report = (report_dirs[0] / "report.txt").read_text()
+            # Pruned down to the days since yesterday
+            storage = SQLiteStorage()
+            self.assertEqual(storage.get_latest_date_with_dispatch_ids(), (date(2023, 2, 3), [3]))
+            self.assertEqual(
+                [row[0] for row in storage.connection.execute("SELECT entry_date FROM days")],
+                ["2023-02-02", "2023-02-03"]
+            )
+            storage.connection.close()
+        for heading in ("fill_through_date", "prune", "asyncio tasks"):
+            self.assertIn(f"===== {heading} =====", report)
+        self.assertIn("Peak traced memory", report)
+        self.assertIn("iter_dispatch_entries_for_date_range", report)
+        # The blocking call was caught
+        # (along with any others that happened to be slow on a busy machine)
+        durations = re.findall(r"Executing <Task .*> took (\d+\.\d+) seconds", report)
+        self.assertGreaterEqual(max(map(float, durations), default=0), 0.1)
+
+    def test_report__slow_callback_without_tasks(self):
+        """
+        Tests that callbacks blocking the event loop are reported even if no
+        tasks were timed.
+        """
+        loop = asyncio.new_event_loop()
+        with TemporaryDirectory() as report_dir:
+            profiler = RunProfiler(Path(report_dir), slow_callback_duration=0.05)
+            try:
+                profiler.instrument(loop)
+                loop.call_soon(time.sleep, 0.1)
+                loop.call_soon(loop.stop)
+                loop.run_forever()
+            finally:
+                loop.close()
+                report = profiler.write_report().read_text()
+        self.assertNotIn("===== asyncio tasks =====", report)
+        self.assertIn("===== Callbacks blocking the event loop for over 0.05s =====", report)
+        self.assertRegex(report, r"Executing <Handle sleep\(0\.1\).*> took \d+\.\d+ seconds")
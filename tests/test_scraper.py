@@ -1,20 +1,35 @@
-from asyncio import run
-from datetime import date
+import asyncio
+from contextlib import aclosing
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from tempfile import TemporaryDirectory
 from unittest import IsolatedAsyncioTestCase
 from unittest.mock import call, MagicMock, patch
 
-from aiohttp import ClientResponse
+from aiohttp import ClientConnectionError, ClientResponse, ClientTimeout, web
+from aiohttp.test_utils import TestServer
 
-from blotter import BlotterEntry
+from blotter import BlotterEntry, parse_blotter_page, parse_details_page, UnexpectedPageLayout
 from icbot.config import settings
 from scraper import (
     BadResponse,
+    CircuitOpenError,
+    DeadlineExceeded,
+    DispatchEntrySet,
     fetch_dispatch_entries,
     fetch_dispatch_entries_for_date_range,
+    iter_dispatch_entries_for_date_range,
+    parse_retry_after,
+    RequestFailed,
+    RetryPolicy,
     Scraper
 )
+from utils.http_cache import ResponseCache
+from utils.page_fingerprints import PageFingerprint, PageFingerprints
+from .fake_police_log import FakePoliceLog
 from .test_blotter import (
     MOCK_BLOTTER_PAGE_TEMPLATE,
+    MOCK_BLOTTER_PAGE_TABLE,
     MOCK_BLOTTER_PAGE_TABLE_TEMPLATE,
     MOCK_BLOTTER_ENTRY_PAGE_TEMPLATE,
     MOCK_BLOTTER_ENTRY_CONTENTS
@@ -45,7 +60,8 @@ class ScraperTestCase(IsolatedAsyncioTestCase):
         mock_response = MagicMock(spec=ClientResponse)
         mock_response.status = 400
         mock_session.return_value.get.return_value.__aenter__.return_value = mock_response
-        scraper = Scraper()
+        with settings.override({"REQUEST_MAX_ATTEMPTS": 1}):
+            scraper = Scraper()
         test_url = "http://foo.bar"
         async with scraper.session() as session:
             with self.assertRaises(BadResponse) as context:
@@ -62,6 +78,184 @@ class ScraperTestCase(IsolatedAsyncioTestCase):
         self.assertEqual(context.exception.status, 503)
         self.assertEqual(context.exception.request_method, "post")
 
+    async def test_retries(self, mock_session: MagicMock):
+        """
+        Tests that transient failures of idempotent requests are retried
+        (honoring any Retry-After header) until the retry policy runs out of
+        attempts, and that other failures are not.
+        """
+        def make_response(status: int, headers: dict[str, str] = {}) -> MagicMock:
+            mock_response = MagicMock(spec=ClientResponse)
+            mock_response.status = status
+            mock_response.headers = headers
+            mock_response.text.return_value = "success"
+            return mock_response
+
+        mock_session.return_value.get.return_value.__aenter__.side_effect = [
+            make_response(503),
+            ClientConnectionError("Connection reset"),
+            make_response(429, {"Retry-After": "0.05"}),
+            make_response(200),
+            make_response(404),
+            make_response(500),
+            make_response(500),
+            make_response(503, {"Retry-After": "3600"})
+        ]
+        mock_session.return_value.post.return_value.__aenter__.return_value = make_response(503)
+        scraper = Scraper(
+            requests_per_second_per_host=0,
+            retry_policy=RetryPolicy(max_attempts=4, backoff=0.001),
+            circuit_breaker_threshold=0
+        )
+        test_url = "http://foo.bar"
+        async with scraper.session() as session:
+            started_at = asyncio.get_running_loop().time()
+            self.assertEqual(await scraper.fetch_one(session, test_url), "success")
+            self.assertGreaterEqual(asyncio.get_running_loop().time() - started_at, 0.05)
+            self.assertEqual((scraper.stats.retries, scraper.stats.failures), (3, 0))
+            # Not worth retrying
+            with self.assertRaises(BadResponse) as context:
+                await scraper.fetch_one(session, test_url)
+            self.assertEqual(context.exception.status, 404)
+            # Not safe to retry
+            with self.assertRaises(BadResponse):
+                await scraper.fetch_one(session, test_url, "post")
+            # Asked to wait for longer than the maximum backoff
+            with self.assertRaises(BadResponse) as context:
+                await scraper.fetch_one(session, test_url)
+            self.assertEqual(context.exception.status, 503)
+            self.assertEqual(context.exception.retry_after, 3600)
+        self.assertEqual(mock_session.return_value.get.call_count, 8)
+        self.assertEqual(mock_session.return_value.post.call_count, 1)
+        self.assertEqual((scraper.stats.retries, scraper.stats.failures), (5, 3))
+
+        # Transient errors that are raised in the end are wrapped
+        mock_session.return_value.get.return_value.__aenter__.side_effect = ClientConnectionError()
+        scraper = Scraper(retry_policy=RetryPolicy(max_attempts=2, backoff=0.001))
+        async with scraper.session() as session:
+            with self.assertRaises(RequestFailed) as context:
+                await scraper.fetch_one(session, test_url)
+        self.assertIsInstance(context.exception.error, ClientConnectionError)
+        self.assertEqual(scraper.stats.retries, 1)
+
+    async def test_circuit_breaker(self, mock_session: MagicMock):
+        """
+        Tests that requests to a host fail immediately once enough consecutive
+        attempts to reach it have failed, that other hosts are unaffected, and
+        that a single trial request is let through after the reset timeout.
+        """
+        mock_response = MagicMock(spec=ClientResponse)
+        mock_response.status = 503
+        mock_response.headers = {}
+        mock_response.text.return_value = "success"
+        mock_session.return_value.get.return_value.__aenter__.return_value = mock_response
+        scraper = Scraper(
+            retry_policy=RetryPolicy(max_attempts=2, backoff=0.001),
+            circuit_breaker_threshold=3,
+            circuit_breaker_reset_timeout=0.05
+        )
+        async with scraper.session() as session:
+            with self.assertRaises(BadResponse):
+                await scraper.fetch_one(session, "http://foo.bar/1")
+            # The circuit opens before the retry
+            with self.assertRaises(CircuitOpenError):
+                await scraper.fetch_one(session, "http://foo.bar/2")
+            with self.assertRaises(CircuitOpenError):
+                await scraper.fetch_one(session, "http://foo.bar/3")
+            self.assertEqual(mock_session.return_value.get.call_count, 3)
+            self.assertEqual(scraper.stats.short_circuits, 2)
+            mock_response.status = 200
+            self.assertEqual(await scraper.fetch_one(session, "http://baz.quux/1"), "success")
+            await asyncio.sleep(0.05)
+            trial = asyncio.ensure_future(scraper.fetch_one(session, "http://foo.bar/3"))
+            await asyncio.sleep(0)
+            # Only the trial request gets through while it's in flight
+            with self.assertRaises(CircuitOpenError):
+                await scraper.fetch_one(session, "http://foo.bar/4")
+            self.assertEqual(await trial, "success")
+            self.assertEqual(await scraper.fetch_one(session, "http://foo.bar/4"), "success")
+
+    async def test_circuit_breaker__cancelled_trial(self, mock_session: MagicMock):
+        """
+        Tests that a trial request that is cancelled doesn't leave the circuit
+        open for good.
+        """
+        trial_started = asyncio.Event()
+        never = asyncio.Event()
+        statuses = [503, None, 200]
+
+        async def mock_enter(*args):
+            status = statuses.pop(0)
+            if status is None:
+                trial_started.set()
+                await never.wait()
+            mock_response = MagicMock(spec=ClientResponse)
+            mock_response.status = status
+            mock_response.headers = {}
+            mock_response.text.return_value = "success"
+            return mock_response
+
+        mock_session.return_value.get.return_value.__aenter__.side_effect = mock_enter
+        scraper = Scraper(
+            requests_per_second_per_host=0,
+            retry_policy=RetryPolicy(max_attempts=1),
+            circuit_breaker_threshold=1,
+            circuit_breaker_reset_timeout=0.01
+        )
+        async with scraper.session() as session:
+            with self.assertRaises(BadResponse):
+                await scraper.fetch_one(session, "http://foo.bar/1")
+            await asyncio.sleep(0.01)
+            trial = asyncio.ensure_future(scraper.fetch_one(session, "http://foo.bar/2"))
+            await asyncio.wait_for(trial_started.wait(), 1)
+            with self.assertRaises(CircuitOpenError):
+                await scraper.fetch_one(session, "http://foo.bar/3")
+            trial.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await trial
+            # The next request is let through as the trial instead
+            self.assertEqual(await scraper.fetch_one(session, "http://foo.bar/4"), "success")
+        self.assertEqual(scraper.stats.short_circuits, 1)
+
+    def test_parse_retry_after(self, mock_session: MagicMock):
+        self.assertEqual(parse_retry_after("120"), 120)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0)
+        self.assertAlmostEqual(
+            parse_retry_after(
+                (datetime.now(tz=timezone.utc) + timedelta(minutes=5)).strftime(
+                    "%a, %d %b %Y %H:%M:%S GMT"
+                )
+            ),
+            300,
+            delta=2
+        )
+
+    async def test_session_settings(self, mock_session: MagicMock):
+        """
+        Tests that the session is built from the connection settings, and that
+        brotli is only offered when it can be decoded.
+        """
+        with settings.override({
+            "HTTP_CONNECTOR": {"limit": 3, "limit_per_host": 2, "ttl_dns_cache": 42},
+            "HTTP_TIMEOUT": {"total": 5, "connect": 1},
+            "HTTP_ACCEPT_ENCODINGS": ["br", "gzip"]
+        }):
+            with patch("scraper.import_module", side_effect=ImportError):
+                async with Scraper().session():
+                    session_kwargs = mock_session.call_args.kwargs
+                    connector = session_kwargs["connector"]
+                    self.assertEqual((connector.limit, connector.limit_per_host), (3, 2))
+                    self.assertEqual(session_kwargs["timeout"], ClientTimeout(total=5, connect=1))
+                    self.assertEqual(session_kwargs["headers"], {"Accept-Encoding": "gzip"})
+            self.assertTrue(connector.closed)
+            with patch("scraper.import_module"):
+                async with Scraper().session():
+                    self.assertEqual(
+                        mock_session.call_args.kwargs["headers"], {"Accept-Encoding": "br, gzip"}
+                    )
+
     async def test_http_success(self, mock_session: MagicMock):
         mock_response = MagicMock(spec=ClientResponse)
         mock_response.status = 200
@@ -196,7 +390,8 @@ class ScraperTestCase(IsolatedAsyncioTestCase):
                 "DISPOSITIONS": [],
                 "DETAILS": ["QUIET"]
             },
-            "POLICE_LOG_URL": "http://test/police/log"
+            "POLICE_LOG_URL": "http://test/police/log",
+            "REQUEST_MAX_ATTEMPTS": 1
         }):
             entry_set = await fetch_dispatch_entries(dt)
         self.assertEqual(entry_set.date, dt)
@@ -254,3 +449,505 @@ class ScraperTestCase(IsolatedAsyncioTestCase):
             details="All quiet on the western front",
             error=None
         ))
+
+    async def test_fetch_dispatch_entries_for_date_range(self, mock_session: MagicMock):
+        """
+        Tests that days in a range are fetched concurrently, with no more than
+        the configured number of days in flight at once, and that results are
+        returned in date order regardless of completion order.
+        """
+        in_flight = 0
+        max_in_flight = 0
+        scrapers = set()
+
+        async def mock_fetch(for_date, skip_ids, scraper):
+            nonlocal in_flight, max_in_flight
+            scrapers.add(scraper)
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            # Make earlier days finish later than later ones
+            await asyncio.sleep(0.01 * (10 - for_date.day))
+            in_flight -= 1
+            return DispatchEntrySet(date=for_date, entries=[])
+
+        with patch("scraper.fetch_dispatch_entries", side_effect=mock_fetch):
+            entry_sets = await fetch_dispatch_entries_for_date_range(
+                date(2023, 2, 1),
+                date(2023, 2, 7),
+                max_concurrent_days=3
+            )
+        self.assertEqual(
+            [entry_set.date for entry_set in entry_sets],
+            [date(2023, 2, day) for day in range(1, 8)]
+        )
+        self.assertEqual(max_in_flight, 3)
+        self.assertEqual(len(scrapers), 1)
+        mock_session.assert_called_once()
+        self.assertEqual(await fetch_dispatch_entries_for_date_range(
+            date(2023, 2, 2), date(2023, 2, 1)
+        ), [])
+
+    async def test_iter_dispatch_entries_for_date_range(self, mock_session: MagicMock):
+        """
+        Tests that days are yielded in date order as they become ready, that
+        no new day is started while the configured number of days are waiting
+        to be consumed, and that closing the iterator early cancels the days
+        still in flight.
+        """
+        started = []
+        cancelled = []
+
+        never = asyncio.Event()
+
+        async def mock_fetch(for_date, skip_ids, scraper):
+            started.append(for_date)
+            try:
+                # Later days never finish unless cancelled
+                if for_date.day > 2:
+                    await never.wait()
+            except asyncio.CancelledError:
+                cancelled.append(for_date)
+                raise
+            return DispatchEntrySet(date=for_date, entries=[])
+
+        with patch("scraper.fetch_dispatch_entries", side_effect=mock_fetch):
+            entry_sets = iter_dispatch_entries_for_date_range(
+                date(2023, 2, 1),
+                date(2023, 2, 28),
+                max_concurrent_days=2
+            )
+            self.assertEqual((await anext(entry_sets)).date, date(2023, 2, 1))
+            # A slow consumer holds up scraping
+            await asyncio.sleep(0.05)
+            self.assertEqual(started, [date(2023, 2, 1), date(2023, 2, 2)])
+            self.assertEqual((await anext(entry_sets)).date, date(2023, 2, 2))
+            await asyncio.sleep(0)
+            await entry_sets.aclose()
+        self.assertEqual(started, [date(2023, 2, day) for day in range(1, 4)])
+        self.assertEqual(cancelled, [date(2023, 2, 3)])
+        mock_session.assert_called_once()
+
+    async def test_request_limits(self, mock_session: MagicMock):
+        """
+        Tests that ``Scraper`` never has more than the configured number of
+        requests in flight, spaces out requests to the same host according to
+        the configured rate, and records how long requests were queued.
+        """
+        in_flight = 0
+        max_in_flight = 0
+        start_times = []
+
+        async def mock_enter(*args):
+            nonlocal in_flight, max_in_flight
+            start_times.append(asyncio.get_running_loop().time())
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.05)
+            in_flight -= 1
+            mock_response = MagicMock(spec=ClientResponse)
+            mock_response.status = 200
+            mock_response.text.return_value = "success"
+            return mock_response
+
+        mock_session.return_value.get.return_value.__aenter__.side_effect = mock_enter
+        scraper = Scraper(max_concurrent_requests=2, requests_per_second_per_host=50)
+        async with scraper.session() as session:
+            began_at = asyncio.get_running_loop().time()
+            responses = await scraper.fetch_many(
+                session, *(f"http://foo.bar/{i}" for i in range(6))
+            )
+        self.assertEqual(responses, ["success"] * 6)
+        self.assertEqual(max_in_flight, 2)
+        # Each request waits for its own slot, 0.02s after the one before (a
+        # stalled loop may start several late at once, but never early)
+        for i, start_time in enumerate(start_times):
+            self.assertGreaterEqual(start_time - began_at, i * 0.02 - 0.001)
+        self.assertEqual(scraper.stats.requests, 6)
+        self.assertGreater(scraper.stats.queue_wait_max, 0.04)
+        self.assertGreater(scraper.stats.queue_wait_mean, 0)
+
+    async def test_hedged_requests(self, mock_session: MagicMock):
+        """
+        Tests that a GET request taking longer than the configured percentile
+        of recent latencies is duplicated, and that the first response wins.
+        """
+        calls = []
+        never = asyncio.Event()
+
+        def mock_get(url, **kwargs):
+            calls.append(url)
+
+            async def mock_enter(*args):
+                # Only the first request for the slow page is slow, so slow
+                # that it never finishes
+                if url == "http://foo.bar/slow" and calls.count(url) == 1:
+                    await never.wait()
+                await asyncio.sleep(0.01)
+                mock_response = MagicMock(spec=ClientResponse)
+                mock_response.status = 200
+                mock_response.text.return_value = f"{url} #{calls.count(url)}"
+                return mock_response
+
+            context_manager = MagicMock()
+            context_manager.__aenter__.side_effect = mock_enter
+            return context_manager
+
+        mock_session.return_value.get.side_effect = mock_get
+        with settings.override({"HEDGE_MIN_SAMPLES": 3}):
+            scraper = Scraper(requests_per_second_per_host=0, hedge_percentile=90)
+        async with scraper.session() as session:
+            # Not enough latencies recorded yet to hedge
+            self.assertIsNone(scraper.get_hedge_delay())
+            await scraper.fetch_many(session, *(f"http://foo.bar/{i}" for i in range(3)))
+            self.assertIsNotNone(scraper.get_hedge_delay())
+            self.assertEqual(
+                await asyncio.wait_for(scraper.fetch_one(session, "http://foo.bar/slow"), 5),
+                "http://foo.bar/slow #2"
+            )
+        self.assertEqual((scraper.stats.hedged_requests, scraper.stats.hedge_wins), (1, 1))
+
+    async def test_fetch_dispatch_entries__deadline(self, mock_session: MagicMock):
+        """
+        Tests that detail pages still outstanding when the day's deadline
+        passes are abandoned, and their entries marked with an error.
+        """
+        def mock_get(url, **kwargs):
+            async def mock_enter(*args):
+                mock_response = MagicMock(spec=ClientResponse)
+                mock_response.status = 200
+                if url == "http://test/police/log":
+                    mock_response.text.return_value = MOCK_BLOTTER_PAGE_TEMPLATE.format(
+                        table_contents=MOCK_BLOTTER_PAGE_TABLE
+                    )
+                else:
+                    await asyncio.sleep(1 if url == "http://test/789" else 0)
+                    mock_response.text.return_value = MOCK_BLOTTER_ENTRY_PAGE_TEMPLATE.format(
+                        entry_contents=MOCK_BLOTTER_ENTRY_CONTENTS
+                    )
+                return mock_response
+
+            context_manager = MagicMock()
+            context_manager.__aenter__.side_effect = mock_enter
+            return context_manager
+
+        mock_session.return_value.get.side_effect = mock_get
+        with settings.override({
+            "BLOCKING_FILTERS": {"ACTIVITIES": [], "DISPOSITIONS": [], "DETAILS": []},
+            "POLICE_LOG_URL": "http://test/police/log"
+        }):
+            scraper = Scraper(requests_per_second_per_host=0, day_deadline=0.1)
+            started_at = asyncio.get_running_loop().time()
+            entry_set = await fetch_dispatch_entries(date(2023, 2, 15), scraper=scraper)
+        self.assertLess(asyncio.get_running_loop().time() - started_at, 0.5)
+        self.assertEqual([entry.dispatch_number for entry in entry_set.entries], [123, 789])
+        self.assertEqual(entry_set.entries[0].details, "All quiet on the western front")
+        self.assertIsNone(entry_set.entries[0].error)
+        self.assertIsNone(entry_set.entries[1].details)
+        self.assertIsInstance(entry_set.entries[1].error, DeadlineExceeded)
+        self.assertEqual(entry_set.entries[1].error.url, "http://test/789")
+
+    async def test_fetch_as_completed(self, mock_session: MagicMock):
+        """
+        Tests that ``Scraper.fetch_as_completed()`` yields each response
+        (tagged with the index of its URL) as soon as it arrives, and that
+        failures are yielded rather than raised.
+        """
+        urls = ["http://foo.bar/1", "http://foo.bar/2", "http://foo.bar/3"]
+        arrived = {url: asyncio.Event() for url in urls}
+
+        def mock_get(url, **kwargs):
+            async def mock_enter(*args):
+                await arrived[url].wait()
+                mock_response = MagicMock(spec=ClientResponse)
+                mock_response.status = 404 if url == "http://foo.bar/2" else 200
+                mock_response.text.return_value = url
+                return mock_response
+
+            context_manager = MagicMock()
+            context_manager.__aenter__.side_effect = mock_enter
+            return context_manager
+
+        mock_session.return_value.get.side_effect = mock_get
+        scraper = Scraper(requests_per_second_per_host=0)
+        responses = []
+        async with scraper.session() as session:
+            async with aclosing(scraper.fetch_as_completed(session, *urls)) as results:
+                for url in ("http://foo.bar/2", "http://foo.bar/3", "http://foo.bar/1"):
+                    arrived[url].set()
+                    # Would time out if responses were yielded in URL order
+                    responses.append(await asyncio.wait_for(anext(results), 1))
+        self.assertEqual([i for i, response in responses], [1, 2, 0])
+        self.assertIsInstance(responses[0][1], BadResponse)
+        self.assertEqual(responses[1][1], "http://foo.bar/3")
+        self.assertEqual(responses[2][1], "http://foo.bar/1")
+
+    async def test_parser_executor(self, mock_session: MagicMock):
+        """
+        Tests that parsing offloaded to a thread or process pool gives the same
+        results (and errors) as parsing inline.
+        """
+        page = MOCK_BLOTTER_PAGE_TEMPLATE.format(table_contents=MOCK_BLOTTER_PAGE_TABLE)
+        expected_rows = parse_blotter_page(page, "http://test/police/log")
+        self.assertEqual(len(expected_rows), 3)
+        for kind in ("thread", "process"):
+            scraper = Scraper(parser_executor=kind)
+            async with scraper.session():
+                self.assertEqual(
+                    await scraper.parse(parse_blotter_page, page, "http://test/police/log"),
+                    expected_rows
+                )
+                with self.assertRaises(UnexpectedPageLayout):
+                    await scraper.parse(parse_details_page, page)
+            self.assertIsNone(scraper._parser_executor)
+
+    async def test_fetch_dispatch_entries__streamed(self, mock_session: MagicMock):
+        """
+        Tests that with ``STREAM_DETAIL_PAGES`` enabled, detail pages are parsed
+        from the response stream rather than read in full.
+        """
+        mock_table = MOCK_BLOTTER_PAGE_TABLE_TEMPLATE.format(table_contents="""
+<tr>
+    <td><a href="/123">123</a></td>
+    <td>123 Fake St</td>
+    <td>FOO</td>
+    <td>COMPLETED</td>
+    <td>Y</td>
+</tr>
+<tr>
+    <td><a href="/456">456</a></td>
+    <td>123 Fake St</td>
+    <td>BAR</td>
+    <td>COMPLETED</td>
+    <td>Y</td>
+</tr>
+""")
+        detail_page = MOCK_BLOTTER_ENTRY_PAGE_TEMPLATE.format(
+            entry_contents=MOCK_BLOTTER_ENTRY_CONTENTS
+        ).encode()
+
+        async def iter_chunked(chunk_size):
+            for i in range(0, len(detail_page), 16):
+                yield detail_page[i:i + 16]
+
+        mock_responses = [MagicMock(spec=ClientResponse) for i in range(3)]
+        mock_responses[0].status = 200
+        mock_responses[0].text.return_value = MOCK_BLOTTER_PAGE_TEMPLATE.format(
+            table_contents=mock_table
+        )
+        mock_responses[1].status = 404
+        mock_responses[2].status = 200
+        mock_responses[2].charset = None
+        mock_responses[2].content.iter_chunked = iter_chunked
+        mock_session.return_value.get.return_value.__aenter__.side_effect = mock_responses
+        dt = date(2023, 2, 15)
+        with settings.override({
+            "BLOCKING_FILTERS": {
+                "ACTIVITIES": [],
+                "DISPOSITIONS": [],
+                "DETAILS": []
+            },
+            "POLICE_LOG_URL": "http://test/police/log",
+            "STREAM_DETAIL_PAGES": True
+        }):
+            entry_set = await fetch_dispatch_entries(dt)
+        self.assertEqual(len(entry_set.entries), 2)
+        self.assertIsInstance(entry_set.entries[0].error, BadResponse)
+        self.assertEqual(entry_set.entries[1].details, "All quiet on the western front")
+        mock_responses[2].text.assert_not_awaited()
+
+    async def test_response_cache(self, mock_session: MagicMock):
+        """
+        Tests that cached GET responses are served without a request while
+        fresh, revalidated with a conditional request once stale, and that
+        requests with form data bypass the cache.
+        """
+        mock_responses = [MagicMock(spec=ClientResponse) for i in range(3)]
+        mock_responses[0].status = 200
+        mock_responses[0].text.return_value = "first"
+        mock_responses[0].headers = {"ETag": '"v1"'}
+        mock_responses[1].status = 304
+        mock_responses[2].status = 200
+        mock_responses[2].text.return_value = "form"
+        mock_responses[2].headers = {}
+        mock_session.return_value.get.return_value.__aenter__.side_effect = mock_responses
+        test_url = "http://foo.bar/1"
+        with TemporaryDirectory() as temp_dir:
+            cache = ResponseCache(Path(temp_dir) / "cache.sqlite3", ttl=60)
+            scraper = Scraper(cache=cache)
+            async with scraper.session() as session:
+                self.assertEqual(await scraper.fetch_one(session, test_url), "first")
+                self.assertEqual(await scraper.fetch_one(session, test_url), "first")
+                self.assertEqual(mock_session.return_value.get.call_count, 1)
+                cache.ttl = 0
+                self.assertEqual(await scraper.fetch_one(session, test_url), "first")
+                self.assertEqual(await scraper.fetch_one(session, test_url, foo="bar"), "form")
+            cache.close()
+        self.assertEqual(mock_session.return_value.get.call_args_list, [
+            call(test_url, data={}),
+            call(test_url, data={}, headers={"If-None-Match": '"v1"'}),
+            call(test_url, data={"foo": "bar"})
+        ])
+        self.assertEqual(
+            (cache.hits, cache.misses, cache.revalidations, cache.evictions),
+            (1, 2, 1, 0)
+        )
+
+    async def test_response_cache__unparseable(self, mock_session: MagicMock):
+        """
+        Tests that a detail page that can't be parsed (e.g. a maintenance page
+        served with a 200) isn't left in the cache, whether or not detail
+        pages are streamed.
+        """
+        blotter_page = MOCK_BLOTTER_PAGE_TEMPLATE.format(table_contents=MOCK_BLOTTER_PAGE_TABLE)
+
+        def mock_get(url, **kwargs):
+            mock_response = MagicMock(spec=ClientResponse)
+            mock_response.status = 200
+            mock_response.headers = {}
+            mock_response.text.return_value = (
+                blotter_page if url == "http://test/police/log" else "Down for maintenance"
+            )
+            context_manager = MagicMock()
+            context_manager.__aenter__.return_value = mock_response
+            return context_manager
+
+        mock_session.return_value.get.side_effect = mock_get
+        for stream_detail_pages in (False, True):
+            with TemporaryDirectory() as temp_dir, settings.override({
+                "BLOCKING_FILTERS": {"ACTIVITIES": [], "DISPOSITIONS": [], "DETAILS": []},
+                "POLICE_LOG_URL": "http://test/police/log",
+                "STREAM_DETAIL_PAGES": stream_detail_pages
+            }):
+                cache = ResponseCache(Path(temp_dir) / "cache.sqlite3", ttl=60)
+                scraper = Scraper(cache=cache)
+                with self.assertRaises(UnexpectedPageLayout):
+                    await fetch_dispatch_entries(date(2023, 2, 15), scraper=scraper)
+                self.assertEqual(cache.connection.execute(
+                    "SELECT COUNT(*) FROM responses"
+                ).fetchone()[0], 0)
+                self.assertEqual(cache.total_size, 0)
+                cache.close()
+
+    async def test_fetch_dispatch_entries__unchanged(self, mock_session: MagicMock):
+        """
+        Tests that once an activity log page's fingerprint has been recorded,
+        fetching the same date again skips everything after the blotter
+        request if the page is the same or the server says it is unchanged.
+        """
+        blotter_page = MOCK_BLOTTER_PAGE_TEMPLATE.format(table_contents=MOCK_BLOTTER_PAGE_TABLE)
+        detail_page = MOCK_BLOTTER_ENTRY_PAGE_TEMPLATE.format(entry_contents=MOCK_BLOTTER_ENTRY_CONTENTS)
+        mock_responses = [MagicMock(spec=ClientResponse) for i in range(6)]
+        for mock_response, status, text, headers in zip(mock_responses, (200, 200, 200, 200, 304, 200), (
+            blotter_page, detail_page, detail_page, blotter_page, None, blotter_page.replace("BAZ", "QUUX")
+        ), (
+            {"ETag": '"v1"'}, {}, {}, {"ETag": '"v1"'}, {}, {"ETag": '"v2"'}
+        )):
+            mock_response.status = status
+            mock_response.text.return_value = text
+            mock_response.headers = headers
+        mock_session.return_value.get.return_value.__aenter__.side_effect = mock_responses
+        dt = date(2023, 2, 15)
+        overrides = {
+            "BLOCKING_FILTERS": {"ACTIVITIES": [], "DISPOSITIONS": [], "DETAILS": []},
+            "POLICE_LOG_URL": "http://test/police/log"
+        }
+        with TemporaryDirectory() as temp_dir, settings.override(overrides):
+            path = Path(temp_dir) / "fingerprints.json"
+            scraper = Scraper(fingerprints=PageFingerprints(path))
+            entry_set = await fetch_dispatch_entries(dt, scraper=scraper)
+            self.assertFalse(entry_set.unchanged)
+            self.assertEqual(len(entry_set.entries), 2)
+            self.assertEqual(entry_set.fingerprint.etag, '"v1"')
+            scraper.fingerprints.record(dt, entry_set.fingerprint)
+            scraper.fingerprints.save()
+
+            # Same content, sent again in full
+            scraper = Scraper(fingerprints=PageFingerprints(path))
+            entry_set = await fetch_dispatch_entries(dt, scraper=scraper)
+            self.assertTrue(entry_set.unchanged)
+            self.assertEqual(entry_set.entries, [])
+            # 304 Not Modified
+            entry_set = await fetch_dispatch_entries(dt, scraper=scraper)
+            self.assertTrue(entry_set.unchanged)
+            self.assertEqual(mock_session.return_value.get.call_args_list[-1], call(
+                "http://test/police/log",
+                data={"activityDate": dt.strftime(settings.POLICE_LOG_DATETIME_FORMAT)},
+                headers={"If-None-Match": '"v1"'}
+            ))
+            self.assertEqual(mock_session.return_value.get.call_count, 5)
+            # Changed content, and no detail requests left to answer because
+            # both entries are skipped
+            entry_set = await fetch_dispatch_entries(dt, [123, 789], scraper=scraper)
+            self.assertFalse(entry_set.unchanged)
+            self.assertEqual(entry_set.fingerprint.etag, '"v2"')
+            # The filters in effect are part of the fingerprint
+            with settings.override({"BLOCKING_FILTERS": {"ACTIVITIES": ["FOO"]}}):
+                self.assertNotEqual(
+                    entry_set.fingerprint.digest,
+                    PageFingerprint.from_content(
+                        blotter_page.replace("BAZ", "QUUX"), repr(settings.BLOCKING_FILTERS)
+                    ).digest
+                )
+
+
+class ScraperConnectionTestCase(IsolatedAsyncioTestCase):
+    async def test_connection_reuse(self):
+        """
+        Tests that requests to the same host share a kept-alive connection, and
+        that the scraper counts how often connections are reused.
+        """
+        async def handler(request: web.Request) -> web.Response:
+            return web.Response(text="success")
+
+        app = web.Application()
+        app.router.add_get("/{page}", handler)
+        async with TestServer(app) as server:
+            scraper = Scraper(requests_per_second_per_host=0)
+            async with scraper.session() as session:
+                for i in range(5):
+                    self.assertEqual(
+                        await scraper.fetch_one(session, str(server.make_url(f"/{i}"))),
+                        "success"
+                    )
+        self.assertEqual(scraper.stats.connections_created, 1)
+        self.assertEqual(scraper.stats.connections_reused, 4)
+        self.assertEqual(scraper.stats.connection_reuse_rate, 0.8)
+
+    async def test_fetch_dispatch_entries_for_date_range(self):
+        """
+        Tests scraping a range of days end to end over real sockets, from a
+        site that is slow and sometimes fails.
+        """
+        fake_police_log = FakePoliceLog(
+            rows_per_day=30, latency=0.001, latency_jitter=0.005, error_rate=0.1, seed=1
+        )
+        async with fake_police_log.serve() as url:
+            with settings.override({
+                "POLICE_LOG_URL": url,
+                "BLOCKING_FILTERS": {"ACTIVITIES": ["ACTIVITY 1$"], "DISPOSITIONS": [], "DETAILS": []},
+                "REQUEST_RETRY_BACKOFF": 0.001
+            }):
+                scraper = Scraper(max_concurrent_requests=4, requests_per_second_per_host=0)
+                entry_sets = await fetch_dispatch_entries_for_date_range(
+                    date(2023, 2, 1), date(2023, 2, 3), scraper=scraper
+                )
+        self.assertEqual([entry_set.date for entry_set in entry_sets], [
+            date(2023, 2, 1), date(2023, 2, 2), date(2023, 2, 3)
+        ])
+        for entry_set in entry_sets:
+            # Every third row has no details, and one in 40 is filtered out
+            self.assertEqual(len(entry_set.entries), 19)
+            for entry in entry_set.entries:
+                self.assertIsNone(entry.error)
+                self.assertEqual(entry.details, f"Details of dispatch {entry.dispatch_number}")
+        self.assertGreater(fake_police_log.errors, 0)
+        self.assertEqual(scraper.stats.retries, fake_police_log.errors)
+        self.assertEqual(scraper.stats.requests, fake_police_log.requests)
+        # Every stage is timed
+        histograms = scraper.metrics.histograms
+        for stage in ("blotter_fetch", "blotter_parse", "first_filter", "second_filter"):
+            self.assertEqual(histograms[f"{stage}_seconds"].count, 3)
+        self.assertEqual(histograms["detail_fetch_seconds"].count, 3 * 19)
+        self.assertEqual(histograms["detail_parse_seconds"].count, 3 * 19)
+        self.assertEqual(scraper.metrics.counters["entries_listed"], 3 * 30)
+        self.assertEqual(scraper.metrics.counters["entries_excluded_first_pass"], 3 * 11)
@@ -0,0 +1,30 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from utils.seen_ids import SeenDispatchIndex
+
+
+class SeenDispatchIndexTestCase(TestCase):
+    def test_membership_and_persistence(self):
+        dispatch_numbers = [0, 7, 8, 65535, 65536, 23000123, 23000124, 24000001]
+        with TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "seen.bin"
+            index = SeenDispatchIndex(path)
+            self.assertEqual(len(index), 0)
+            self.assertNotIn(23000123, index)
+            index.update(dispatch_numbers)
+            index.add(7)
+            for dispatch_number in dispatch_numbers:
+                self.assertIn(dispatch_number, index)
+            for dispatch_number in (1, 9, 65537, 23000125, -1, "23000123"):
+                self.assertNotIn(dispatch_number, index)
+            self.assertEqual(len(index), len(dispatch_numbers))
+            index.save()
+            # Four sparse 8 KiB blocks compress to far less
+            self.assertLess(path.stat().st_size, 1024)
+            index = SeenDispatchIndex(path)
+            self.assertEqual(list(index), dispatch_numbers)
+            path.write_bytes(b"garbage")
+            with self.assertRaises(ValueError):
+                SeenDispatchIndex(path)
@@ -0,0 +1,78 @@
+from datetime import date
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch, PropertyMock
+
+from blotter import BlotterEntry
+from icbot.config import settings
+from scraper import BadResponse, DispatchEntrySet
+from storage import SQLiteStorage
+from storage.base import get_concrete_storage
+
+
+def make_entry(dispatch_number: int, **kwargs) -> BlotterEntry:
+    return BlotterEntry(**{
+        "dispatch_number": dispatch_number,
+        "url": f"http://test/{dispatch_number}",
+        "activity": "FOO",
+        "disposition": "COMPLETED",
+        "has_details": True,
+        "details": "All quiet on the western front",
+        **kwargs
+    })
+
+
+class SQLiteStorageTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.storage = get_concrete_storage(
+            False,
+            "storage.SQLiteStorage",
+            path=Path(self.temp_dir.name) / "test.sqlite3",
+            retention_days=7
+        )
+
+    def tearDown(self):
+        self.storage.connection.close()
+        self.temp_dir.cleanup()
+
+    def test_store_and_get_latest(self):
+        self.assertIsInstance(self.storage, SQLiteStorage)
+        self.assertEqual(self.storage.get_latest_date_with_dispatch_ids(), (None, []))
+        self.storage.store_entries(DispatchEntrySet(date=date(2023, 2, 14), entries=[
+            make_entry(1)
+        ]))
+        self.storage.store_entries(DispatchEntrySet(date=date(2023, 2, 15), entries=[
+            make_entry(3),
+            make_entry(2, details=None, error=BadResponse("get", "http://test/2", 500))
+        ]))
+        self.assertEqual(
+            self.storage.get_latest_date_with_dispatch_ids(),
+            (date(2023, 2, 15), [2, 3])
+        )
+        # Storing the same entries again doesn't duplicate them
+        self.storage.store_entries(DispatchEntrySet(date=date(2023, 2, 15), entries=[make_entry(3)]))
+        self.assertEqual(self.storage.connection.execute(
+            "SELECT dispatch_number, details, error FROM entries WHERE entry_date = '2023-02-15'"
+        ).fetchall(), [
+            (2, None, "GET request to http://test/2 failed with response 500"),
+            (3, "All quiet on the western front", None)
+        ])
+        # A day with no entries still counts as the latest
+        self.storage.store_entries(DispatchEntrySet(date=date(2023, 2, 16), entries=[]))
+        self.assertEqual(self.storage.get_latest_date_with_dispatch_ids(), (date(2023, 2, 16), []))
+
+    def test_prune(self):
+        for day in (1, 7, 8, 9):
+            self.storage.store_entries(DispatchEntrySet(date=date(2023, 2, day), entries=[
+                make_entry(day)
+            ]))
+        with patch.object(type(settings), "current_date", new_callable=PropertyMock) as current_date:
+            current_date.return_value = date(2023, 2, 15)
+            self.storage.prune()
+        self.assertEqual(
+            self.storage.connection.execute("SELECT dispatch_number FROM entries").fetchall(),
+            [(8,), (9,)]
+        )
+        self.assertEqual(self.storage.get_latest_date_with_dispatch_ids(), (date(2023, 2, 9), [9]))
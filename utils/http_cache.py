@@ -0,0 +1,174 @@
+import sqlite3, time
+from dataclasses import dataclass
+from functools import cached_property
+from pathlib import Path
+from typing import Optional
+
+
+def get_validator_headers(etag: Optional[str], last_modified: Optional[str]) -> dict[str, str]:
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+@dataclass
+class CachedResponse:
+    url: str
+    body: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    stored_at: float
+
+    def get_validator_headers(self) -> dict[str, str]:
+        return get_validator_headers(self.etag, self.last_modified)
+
+
+class ResponseCache:
+    """
+    A persistent cache of response bodies keyed by URL, backed by SQLite.
+    Entries older than ``ttl`` seconds are stale and should be revalidated
+    before use; once the stored bodies exceed ``max_size`` bytes, the least
+    recently used entries are evicted.
+    """
+    def __init__(self, path: Path, ttl: Optional[float] = None, max_size: Optional[int] = None):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self._total_size = None
+
+    @classmethod
+    def from_settings(cls) -> Optional["ResponseCache"]:
+        from icbot.config import settings
+
+        if not settings.HTTP_CACHE:
+            return None
+        return cls(
+            settings.DATA_DIR / "http_cache.sqlite3",
+            ttl=settings.HTTP_CACHE.get("ttl"),
+            max_size=settings.HTTP_CACHE.get("max_size")
+        )
+
+    @cached_property
+    def connection(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+            url TEXT PRIMARY KEY,
+            body TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            stored_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            size INTEGER NOT NULL
+        )""")
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+        )
+        return connection
+
+    @property
+    def total_size(self) -> int:
+        if self._total_size is None:
+            self._total_size = self.connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+        return self._total_size
+
+    def is_fresh(self, response: CachedResponse) -> bool:
+        return self.ttl is None or time.time() - response.stored_at < self.ttl
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        """
+        Returns the cached response for the URL, if any, whether or not it is
+        fresh. Only fresh responses count as hits.
+        """
+        row = self.connection.execute(
+            "SELECT body, etag, last_modified, stored_at FROM responses WHERE url = ?",
+            (url,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        response = CachedResponse(url, *row)
+        if self.is_fresh(response):
+            self.hits += 1
+        else:
+            self.misses += 1
+        with self.connection:
+            self.connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE url = ?", (time.time(), url)
+            )
+        return response
+
+    def put(
+        self,
+        url: str,
+        body: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ):
+        now = time.time()
+        size = len(body.encode())
+        total_size = self.total_size
+        with self.connection:
+            previous = self.connection.execute(
+                "SELECT size FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, body, etag, last_modified, now, now, size)
+            )
+        self._total_size = total_size + size - (previous[0] if previous else 0)
+        self.evict()
+
+    def revalidate(self, url: str):
+        """
+        Marks the cached response for the URL as fresh, e.g. after the server
+        has responded to a conditional request with 304 Not Modified.
+        """
+        self.revalidations += 1
+        with self.connection:
+            self.connection.execute(
+                "UPDATE responses SET stored_at = ? WHERE url = ?", (time.time(), url)
+            )
+
+    def delete(self, url: str):
+        """
+        Removes the cached response for the URL, if any, e.g. because its body
+        turned out not to be the page expected.
+        """
+        total_size = self.total_size
+        with self.connection:
+            previous = self.connection.execute(
+                "SELECT size FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            self.connection.execute("DELETE FROM responses WHERE url = ?", (url,))
+        self._total_size = total_size - (previous[0] if previous else 0)
+
+    def evict(self):
+        if self.max_size is None or self.total_size <= self.max_size:
+            return
+        evicted_urls = []
+        for url, size in self.connection.execute(
+            "SELECT url, size FROM responses ORDER BY accessed_at"
+        ).fetchall():
+            if self._total_size <= self.max_size:
+                break
+            evicted_urls.append((url,))
+            self._total_size -= size
+        with self.connection:
+            self.connection.executemany("DELETE FROM responses WHERE url = ?", evicted_urls)
+        self.evictions += len(evicted_urls)
+
+    def close(self):
+        if "connection" in self.__dict__:
+            self.connection.close()
+            del self.__dict__["connection"]
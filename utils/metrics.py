@@ -0,0 +1,127 @@
+import json, time
+from bisect import bisect_left
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+# Upper bounds, in seconds, of the histogram buckets durations are counted in
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+@dataclass
+class Histogram:
+    buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    # Per bucket (not cumulative), with one more for values above the last
+    counts: list[int] = field(default_factory=list)
+    sum: float = 0.0
+    count: int = 0
+
+    def __post_init__(self):
+        if not self.counts:
+            self.counts = [0] * (len(self.buckets) + 1)
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def get_cumulative_counts(self) -> Iterator[tuple[float, int]]:
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics:
+    """
+    Counters, gauges and histograms (of durations, mostly) recorded over the
+    course of a run, which may be written out as JSON or in the Prometheus
+    text format (e.g., for node_exporter's textfile collector).
+    """
+    def __init__(self, prefix: str = "icbot_"):
+        self.prefix = prefix
+        self.counters: dict[str, float] = {}
+        self.gauges: dict[str, float] = {}
+        self.histograms: dict[str, Histogram] = {}
+
+    @classmethod
+    def from_settings(cls) -> Optional["Metrics"]:
+        from icbot.config import settings
+
+        if settings.METRICS_FORMAT is None:
+            return None
+        return cls()
+
+    def increment(self, name: str, amount: float = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value: float):
+        self.gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        if name not in self.histograms:
+            self.histograms[name] = Histogram()
+        self.histograms[name].observe(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """
+        Records the time spent in the context in the histogram
+        ``<name>_seconds``, whether or not it raises.
+        """
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - started_at)
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "counters": self.counters,
+            "gauges": self.gauges,
+            "histograms": {
+                name: {
+                    "buckets": {
+                        str(bound): count for bound, count in histogram.get_cumulative_counts()
+                    },
+                    "sum": histogram.sum,
+                    "count": histogram.count
+                } for name, histogram in self.histograms.items()
+            }
+        }
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            name = f"{self.prefix}{name}_total"
+            lines += [f"# TYPE {name} counter", f"{name} {value}"]
+        for name, value in sorted(self.gauges.items()):
+            name = self.prefix + name
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+        for name, histogram in sorted(self.histograms.items()):
+            name = self.prefix + name
+            lines.append(f"# TYPE {name} histogram")
+            for bound, count in histogram.get_cumulative_counts():
+                lines.append('{}_bucket{{le="{}"}} {}'.format(
+                    name, "+Inf" if bound == float("inf") else bound, count
+                ))
+            lines += [f"{name}_sum {histogram.sum}", f"{name}_count {histogram.count}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path, format: str = "prometheus"):
+        # Written to a temporary file first so that a collector never reads a
+        # partial one
+        temp_path = path.with_suffix(".tmp")
+        with temp_path.open("w") as f:
+            if format == "json":
+                json.dump(self.to_json(), f, indent=2)
+            else:
+                f.write(self.to_prometheus())
+        temp_path.replace(path)
+
+    def write_to_data_dir(self):
+        from icbot.config import settings
+
+        extension = "json" if settings.METRICS_FORMAT == "json" else "prom"
+        self.write(settings.DATA_DIR / f"icbot_metrics.{extension}", settings.METRICS_FORMAT)
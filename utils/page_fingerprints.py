@@ -0,0 +1,74 @@
+import hashlib, json
+from dataclasses import asdict, dataclass
+from datetime import date
+from pathlib import Path
+from typing import Optional
+
+from .http_cache import get_validator_headers
+
+
+@dataclass
+class PageFingerprint:
+    digest: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    @classmethod
+    def from_content(
+        cls,
+        content: str,
+        *salts: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ) -> "PageFingerprint":
+        # Salts (e.g. the filters in effect) make the fingerprint change when
+        # anything other than the page itself would change the outcome
+        hasher = hashlib.sha256(content.encode())
+        for salt in salts:
+            hasher.update(b"\0" + salt.encode())
+        return cls(hasher.hexdigest(), etag, last_modified)
+
+    def get_validator_headers(self) -> dict[str, str]:
+        return get_validator_headers(self.etag, self.last_modified)
+
+
+class PageFingerprints:
+    """
+    Remembers the fingerprint of the activity log page for each date as of
+    the last time its entries were stored, persisted as JSON. Only the most
+    recent ``max_dates`` dates are kept.
+    """
+    def __init__(self, path: Path, max_dates: int = 366):
+        self.path = path
+        self.max_dates = max_dates
+        self._fingerprints: dict[str, PageFingerprint] = {}
+        if path.exists():
+            with path.open() as f:
+                self._fingerprints = {
+                    for_date: PageFingerprint(**fingerprint)
+                    for for_date, fingerprint in json.load(f).items()
+                }
+
+    @classmethod
+    def from_settings(cls) -> Optional["PageFingerprints"]:
+        from icbot.config import settings
+
+        if not settings.TRACK_ACTIVITY_LOG_CHANGES:
+            return None
+        return cls(settings.DATA_DIR / "activity_log_fingerprints.json")
+
+    def get(self, for_date: date) -> Optional[PageFingerprint]:
+        return self._fingerprints.get(for_date.isoformat())
+
+    def record(self, for_date: date, fingerprint: PageFingerprint):
+        self._fingerprints[for_date.isoformat()] = fingerprint
+        for stale_date in sorted(self._fingerprints)[:-self.max_dates]:
+            del self._fingerprints[stale_date]
+
+    def save(self):
+        temp_path = self.path.with_suffix(".tmp")
+        with temp_path.open("w") as f:
+            json.dump({
+                for_date: asdict(fingerprint) for for_date, fingerprint in self._fingerprints.items()
+            }, f)
+        temp_path.replace(self.path)
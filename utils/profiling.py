@@ -0,0 +1,142 @@
+import asyncio, cProfile, io, logging, pstats, tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Coroutine, Optional
+
+
+@dataclass
+class TaskTiming:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+class LogRecorder(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.messages: list[str] = []
+
+    def emit(self, record: logging.LogRecord):
+        self.messages.append(record.getMessage())
+
+
+class RunProfiler:
+    """
+    Profiles sections of a run for CPU time (with cProfile) and memory (with
+    tracemalloc snapshots taken before and after), and, given the event loop,
+    times its tasks and collects its warnings about slow callbacks, i.e.,
+    those that blocked the loop for longer than ``slow_callback_duration``
+    seconds. ``write_report()`` writes a summary of all of this to
+    ``report_dir``, along with the raw profiles and snapshots.
+    """
+    def __init__(self, report_dir: Path, slow_callback_duration: float = 0.05, limit: int = 30):
+        self.report_dir = report_dir
+        self.slow_callback_duration = slow_callback_duration
+        # How many lines to report of each listing
+        self.limit = limit
+        self.sections: list[str] = []
+        self.profiles: dict[str, pstats.Stats] = {}
+        self.memory: dict[str, tuple[tracemalloc.Snapshot, tracemalloc.Snapshot, int]] = {}
+        self.task_timings: dict[str, TaskTiming] = {}
+        self.slow_callbacks = LogRecorder()
+        self.asyncio_logger_disabled: Optional[bool] = None
+
+    def instrument(self, loop: asyncio.AbstractEventLoop):
+        loop.set_debug(True)
+        loop.slow_callback_duration = self.slow_callback_duration
+        # Slow callbacks are logged as warnings by the loop in debug mode. The
+        # asyncio logger predates the logging configuration, which disables it
+        asyncio_logger = logging.getLogger("asyncio")
+        self.asyncio_logger_disabled = asyncio_logger.disabled
+        asyncio_logger.disabled = False
+        asyncio_logger.addHandler(self.slow_callbacks)
+
+        def task_factory(
+            loop: asyncio.AbstractEventLoop, coro: Coroutine[Any, Any, Any], **kwargs: Any
+        ) -> asyncio.Task:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+            name = getattr(coro, "__qualname__", repr(coro))
+            created_at = loop.time()
+
+            def on_done(task: asyncio.Task):
+                if name not in self.task_timings:
+                    self.task_timings[name] = TaskTiming()
+                self.task_timings[name].record(loop.time() - created_at)
+
+            task.add_done_callback(on_done)
+            return task
+
+        loop.set_task_factory(task_factory)
+
+    @contextmanager
+    def profile(self, section: str):
+        self.sections.append(section)
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(10)
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+            self.profiles[section] = pstats.Stats(profiler)
+            self.memory[section] = (before, after, peak)
+
+    def get_report(self) -> str:
+        report = io.StringIO()
+        for section in self.sections:
+            if section not in self.profiles:
+                continue
+            report.write(f"===== {section} =====\n\n")
+            before, after, peak = self.memory[section]
+            report.write(f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB\n")
+            report.write(f"Top allocations still held at the end (of {section}):\n")
+            for stat in after.compare_to(before, "lineno")[:self.limit]:
+                report.write(f"  {stat}\n")
+            for sort_key in ("cumulative", "tottime"):
+                report.write(f"\nCPU profile, by {sort_key} (main thread only):\n")
+                stats = self.profiles[section]
+                stats.stream = report
+                stats.sort_stats(sort_key).print_stats(self.limit)
+        if self.task_timings:
+            report.write("===== asyncio tasks =====\n\n")
+            report.write(f"{'Coroutine':<60} {'Count':>7} {'Total (s)':>10} {'Max (s)':>10}\n")
+            for name, timing in sorted(
+                self.task_timings.items(), key=lambda item: item[1].total, reverse=True
+            )[:self.limit]:
+                report.write(f"{name:<60} {timing.count:>7} {timing.total:>10.3f} {timing.max:>10.3f}\n")
+            report.write("\n")
+        if self.slow_callbacks.messages:
+            report.write(
+                f"===== Callbacks blocking the event loop for over "
+                f"{self.slow_callback_duration}s =====\n\n"
+            )
+            for message in self.slow_callbacks.messages:
+                report.write(f"{message}\n")
+        return report.getvalue()
+
+    def write_report(self) -> Path:
+        asyncio_logger = logging.getLogger("asyncio")
+        asyncio_logger.removeHandler(self.slow_callbacks)
+        if self.asyncio_logger_disabled is not None:
+            asyncio_logger.disabled = self.asyncio_logger_disabled
+        self.report_dir.mkdir(parents=True, exist_ok=True)
+        for section, stats in self.profiles.items():
+            stats.dump_stats(self.report_dir / f"{section}.prof")
+            self.memory[section][1].dump(str(self.report_dir / f"{section}.tracemalloc"))
+        report_path = self.report_dir / "report.txt"
+        report_path.write_text(self.get_report())
+        return report_path
@@ -0,0 +1,85 @@
+import struct, zlib
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+
+class SeenDispatchIndex:
+    """
+    A persistent set of dispatch numbers. Numbers are kept as bitmaps over
+    blocks of ``2 ** BLOCK_BITS`` consecutive numbers (dispatch numbers are
+    assigned sequentially, so the bitmaps are dense), making membership checks
+    O(1) and the file compact once compressed.
+    """
+    BLOCK_BITS = 16
+    MAGIC = b"ICBS\x01"
+    BLOCK_HEADER = struct.Struct(">QI")
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self._blocks: dict[int, bytearray] = {}
+        if path is not None and path.exists():
+            self.load()
+
+    @classmethod
+    def from_settings(cls) -> Optional["SeenDispatchIndex"]:
+        from icbot.config import settings
+
+        if not settings.TRACK_SEEN_DISPATCH_IDS:
+            return None
+        return cls(settings.DATA_DIR / "seen_dispatch_ids.bin")
+
+    def _locate(self, dispatch_number: int) -> tuple[int, int, int]:
+        offset = dispatch_number & ((1 << self.BLOCK_BITS) - 1)
+        return dispatch_number >> self.BLOCK_BITS, offset >> 3, 1 << (offset & 7)
+
+    def __contains__(self, dispatch_number: object) -> bool:
+        if not isinstance(dispatch_number, int) or dispatch_number < 0:
+            return False
+        block_index, byte_index, mask = self._locate(dispatch_number)
+        block = self._blocks.get(block_index)
+        return block is not None and bool(block[byte_index] & mask)
+
+    def __iter__(self) -> Iterator[int]:
+        for block_index in sorted(self._blocks):
+            block = self._blocks[block_index]
+            for byte_index, byte in enumerate(block):
+                for bit in range(8):
+                    if byte & (1 << bit):
+                        yield (block_index << self.BLOCK_BITS) + (byte_index << 3) + bit
+
+    def __len__(self) -> int:
+        return sum(int.from_bytes(block, "little").bit_count() for block in self._blocks.values())
+
+    def add(self, dispatch_number: int):
+        block_index, byte_index, mask = self._locate(dispatch_number)
+        block = self._blocks.get(block_index)
+        if block is None:
+            block = self._blocks[block_index] = bytearray(1 << (self.BLOCK_BITS - 3))
+        block[byte_index] |= mask
+
+    def update(self, dispatch_numbers: Iterable[int]):
+        for dispatch_number in dispatch_numbers:
+            self.add(dispatch_number)
+
+    def load(self):
+        data = self.path.read_bytes()
+        if not data.startswith(self.MAGIC):
+            raise ValueError(f"{self.path} is not a dispatch ID index")
+        position = len(self.MAGIC)
+        blocks = {}
+        while position < len(data):
+            block_index, length = self.BLOCK_HEADER.unpack_from(data, position)
+            position += self.BLOCK_HEADER.size
+            blocks[block_index] = bytearray(zlib.decompress(data[position:position + length]))
+            position += length
+        self._blocks = blocks
+
+    def save(self):
+        chunks = [self.MAGIC]
+        for block_index in sorted(self._blocks):
+            compressed = zlib.compress(self._blocks[block_index])
+            chunks.append(self.BLOCK_HEADER.pack(block_index, len(compressed)))
+            chunks.append(compressed)
+        temp_path = self.path.with_suffix(".tmp")
+        temp_path.write_bytes(b"".join(chunks))
+        temp_path.replace(self.path)